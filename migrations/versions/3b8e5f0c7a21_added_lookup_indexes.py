@@ -0,0 +1,37 @@
+"""added lookup indexes
+
+Revision ID: 3b8e5f0c7a21
+Revises: 657d1ae40cd8
+Create Date: 2026-10-18 13:05:42.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e5f0c7a21'
+down_revision: Union[str, None] = '657d1ae40cd8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # books.user_uid and books.created_at are served by the keyset pagination indexes,
+    # booktag(tag_uid, book_uid) by the facet indexes
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_review_book_uid', 'review', ['book_uid'], unique=False)
+    op.create_index('ix_review_user_uid', 'review', ['user_uid'], unique=False)
+    op.create_index('ix_tags_name', 'tags', ['name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tags_name', table_name='tags')
+    op.drop_index('ix_review_user_uid', table_name='review')
+    op.drop_index('ix_review_book_uid', table_name='review')
+    op.drop_index('ix_users_email', table_name='users')
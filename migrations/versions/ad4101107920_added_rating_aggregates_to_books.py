@@ -0,0 +1,51 @@
+"""added rating aggregates to books
+
+Revision ID: ad4101107920
+Revises: 42a740765fae
+Create Date: 2026-10-18 11:20:54.031877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ad4101107920'
+down_revision: Union[str, None] = '42a740765fae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('books', sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('books', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('books', sa.Column('average_rating', sa.Float(), server_default='0', nullable=False))
+
+    # backfill the aggregates of the existing reviews
+    op.execute("""
+        UPDATE books
+        SET review_count = aggregates.review_count,
+            rating_sum = aggregates.rating_sum,
+            average_rating = aggregates.rating_sum::float / aggregates.review_count
+        FROM (
+            SELECT book_uid, count(*) AS review_count, sum(rating) AS rating_sum
+            FROM review
+            WHERE book_uid IS NOT NULL
+            GROUP BY book_uid
+        ) AS aggregates
+        WHERE books.uid = aggregates.book_uid
+    """)
+
+    op.create_index('ix_books_average_rating_created_at_uid', 'books', ['average_rating', 'created_at', 'uid'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_average_rating_created_at_uid', table_name='books')
+    op.drop_column('books', 'average_rating')
+    op.drop_column('books', 'rating_sum')
+    op.drop_column('books', 'review_count')
@@ -5,9 +5,13 @@ from src.reviews.routes import review_router
 from src.tags.routes import tags_router
 from src.headers import header_router
 from contextlib import asynccontextmanager
-from src.db.db import init_db
+import asyncio
+from src.db.redis import sync_revoked_tokens
 from src.errors import register_all_errors
-from src.middleware import register_middleware
+from src.middleware import register_middleware, access_log_listener
+from src.metrics import register_metrics, metrics_router
+from src.db.queries import register_query_tracking
+from src.profiling import register_profiling
 
 
 # determines which code runs before and after the server starts and stops.
@@ -15,8 +19,11 @@ from src.middleware import register_middleware
 async def life_span(app: FastAPI):
     print(f"Server is starting")
     from src.db.models import Book
-    await init_db()
+    access_log_listener.start()
+    blocklist_sync = asyncio.create_task(sync_revoked_tokens())
     yield 
+    blocklist_sync.cancel()
+    access_log_listener.stop()
     print(f"server has been stopped")
 
 
@@ -31,6 +38,7 @@ app = FastAPI(
     docs_url=f"{version_prefix}/docs",
     redoc_url=f"{version_prefix}/redoc",
     openapi_url=f"{version_prefix}/openapi.json",
+    lifespan=life_span
 )
 
 
@@ -39,9 +47,16 @@ register_all_errors(app)
 
 register_middleware(app)
 
+register_metrics(app)
+
+register_query_tracking(app)
+
+register_profiling(app)
+
 
 app.include_router(book_router, prefix=f"/api/{version}/books", tags=["Books"])
 app.include_router(auth_router, prefix=f"/api/{version}/auth", tags=["Auth"])
 app.include_router(review_router,prefix=f"/api/{version}/reviews", tags=["Reviews"])
 app.include_router(tags_router,prefix=f"/api/{version}/tags", tags=["Tags"])
-app.include_router(header_router,prefix=f"/api/{version}/headers", tags=["Get Headers"])
\ No newline at end of file
+app.include_router(header_router,prefix=f"/api/{version}/headers", tags=["Get Headers"])
+app.include_router(metrics_router)
\ No newline at end of file
@@ -0,0 +1,74 @@
+from redis.exceptions import RedisError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from src.db.redis import redis_client
+from src.db.models import User
+from src.cache import LRUCache
+from src.config import Config
+from .schemas import Principal
+from typing import Optional
+import logging
+import time
+
+PRINCIPAL_PREFIX = "principal:"
+
+# Short-lived copy in front of Redis, so a burst of requests by one user costs no round trip.
+# Invalidation only clears it on the worker making the change; others catch up within PRINCIPAL_LOCAL_TTL.
+local_principals = LRUCache(Config.TOKEN_CACHE_SIZE)
+
+
+def principal_cache_key(email:str) -> str:
+    return f"{PRINCIPAL_PREFIX}{email}"
+
+
+async def get_principal(email:str, session:AsyncSession) -> Optional[Principal]:
+    """Return the identity and permissions of a user, or None when there is no such user.
+    
+    Only the four columns of the principal are read on a miss, never the user's books and reviews.
+    """
+    principal = local_principals.get(email)
+    
+    if principal is not None:
+        return principal
+    
+    try:
+        payload = await redis_client.get(principal_cache_key(email))
+        
+    except RedisError as e:
+        logging.warning("Principal cache read failed: %s", e)
+        payload = None
+        
+    if payload is not None:
+        principal = Principal.model_validate_json(payload)
+    else:
+        result = await session.exec(
+            select(User.uid, User.email, User.role, User.is_verified).where(User.email == email)
+        )
+        row = result.first()
+        
+        if row is None:
+            return None
+        
+        principal = Principal.model_validate(row._mapping)
+        
+        try:
+            await redis_client.set(name=principal_cache_key(email), value=principal.model_dump_json(), ex=Config.PRINCIPAL_CACHE_TTL)
+            
+        except RedisError as e:
+            logging.warning("Principal cache write failed: %s", e)
+            
+    local_principals.set(email, principal, expires_at=time.time() + Config.PRINCIPAL_LOCAL_TTL)
+    
+    return principal
+
+
+async def invalidate_principal(email:str) -> None:
+    """Drop the cached principal after the user's role, verification or email changed."""
+    local_principals.delete(email)
+    
+    try:
+        await redis_client.delete(principal_cache_key(email))
+        
+    except RedisError as e:
+        # the entry still expires after PRINCIPAL_CACHE_TTL
+        logging.error("Principal cache invalidation failed: %s", e)
@@ -0,0 +1,64 @@
+"""Pick the bcrypt cost whose hashing time stays under a target latency on this machine.
+
+Usage:
+    python -m src.auth.calibrate --target-ms 250
+
+Run it on the production hardware and set the printed BCRYPT_ROUNDS; existing
+hashes are upgraded to the new cost as their users log in.
+"""
+from passlib.hash import bcrypt
+import argparse
+import statistics
+import time
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 20
+
+
+def measure(rounds:int, samples:int = 3) -> float:
+    """Median milliseconds one bcrypt hash takes at the given cost."""
+    hasher = bcrypt.using(rounds=rounds)
+    timings = []
+
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.hash("calibration password")
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return statistics.median(timings)
+
+
+def calibrate(target_ms:float, samples:int = 3, report=None) -> int:
+    """Return the highest cost whose median hashing time is within target_ms.
+
+    Every extra round doubles the work, so the search stops at the first cost over target.
+    """
+    chosen = MIN_ROUNDS
+
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        elapsed = measure(rounds, samples)
+
+        if report is not None:
+            report(rounds, elapsed)
+
+        if elapsed > target_ms:
+            break
+
+        chosen = rounds
+
+    return chosen
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=250.0, help="hashing latency budget per password")
+    parser.add_argument("--samples", type=int, default=3, help="hashes timed per cost")
+    args = parser.parse_args()
+
+    rounds = calibrate(args.target_ms, args.samples, report=lambda rounds, elapsed: print(f"rounds={rounds}: {elapsed:.1f} ms"))
+
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,22 @@ from fastapi.exceptions import HTTPException
 from fastapi import Request,status, Depends
 from fastapi.security import HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials
-from .utils import decode_token
-from src.db.redis import token_in_blocklist
+from .utils import decode_cached_token
+from src.db.redis import token_in_blocklist, user_token_generation
+from src.timing import timed
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.db.db import get_session
 from .service import UserService
+from .cache import get_principal
+from .schemas import Principal
 from typing import List,Any
-from src.db.models import User
 from src.errors import (
     InvalidToken,
     RefreshTokenRequired,
     AccessTokenRequired,
     InsufficientPermissions,
-    AccountNotVerified
+    AccountNotVerified,
+    UserNotFound
 )
 
 user_service = UserService()
@@ -28,13 +31,18 @@ class TokenBearer(HTTPBearer):
         
         token = creds.credentials
         
-        token_data = decode_token(token)
+        with timed("auth"):
+            token_data = decode_cached_token(token)
         
-        if not self.token_valid(token):
+        if token_data is None:
             raise InvalidToken()
         
-        if await token_in_blocklist(token_data['jti']):
-            raise InvalidToken()
+        with timed("blocklist"):
+            if await token_in_blocklist(token_data['jti']):
+                raise InvalidToken()
+            
+            if token_data.get('gen', 0) < await user_token_generation(token_data['user']['user_uid']):
+                raise InvalidToken()
         
         self.verify_token_data(token_data)
         
@@ -42,7 +50,7 @@ class TokenBearer(HTTPBearer):
         
     def token_valid(self,token:str) -> bool:
         
-        token_data = decode_token(token)
+        token_data = decode_cached_token(token)
         
         # return True if token_data is not None else False
         
@@ -65,18 +73,22 @@ class RefreshTokenBearer(TokenBearer):
             raise RefreshTokenRequired()
 
 
-async def get_current_user(token_details:dict = Depends(AccessTokenBearer()), session:AsyncSession = Depends(get_session)):
+async def get_current_user(token_details:dict = Depends(AccessTokenBearer()), session:AsyncSession = Depends(get_session)) -> Principal:
     user_email = token_details['user']['email']
     
-    user = await user_service.get_user_by_email(user_email,session)
+    with timed("principal"):
+        principal = await get_principal(user_email,session)
+    
+    if principal is None:
+        raise UserNotFound()
     
-    return user
+    return principal
 
 class RoleChecker:
     def __init__(self,allowed_roles:List[str]) -> None:
         self.allowed_roles = allowed_roles
 
-    def __call__(self, current_user : User = Depends(get_current_user)) -> Any:
+    def __call__(self, current_user : Principal = Depends(get_current_user)) -> Any:
         if not current_user.is_verified:
             raise AccountNotVerified()
         if current_user.role in self.allowed_roles:
@@ -0,0 +1,86 @@
+from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from src.config import Config
+from typing import Optional, Tuple
+import asyncio
+import time
+
+# Pinning min and max rounds to the configured cost makes passlib flag every hash made
+# with another cost as needing an update, so logins rehash after BCRYPT_ROUNDS changes.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=Config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=Config.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=Config.BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so hashing never blocks the event loop.
+
+    bcrypt releases the GIL, so the workers hash in parallel; calls beyond the worker
+    count wait in the pool queue, which the counters below expose.
+    """
+
+    def __init__(self, workers:int) -> None:
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.in_flight - self.workers, 0)
+
+    async def run(self, function, *args):
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return started, function(*args)
+
+        self.in_flight += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        self.wait_seconds += started - submitted
+        self.run_seconds += time.perf_counter() - started
+
+        return result
+
+    def as_dict(self) -> dict:
+        return {
+            "workers":self.workers,
+            "in_flight":self.in_flight,
+            "queue_depth":self.queue_depth,
+            "max_queue_depth":self.max_queue_depth,
+            "completed":self.completed,
+            "avg_wait_ms":self.wait_seconds * 1000 / self.completed if self.completed else 0.0,
+            "avg_run_ms":self.run_seconds * 1000 / self.completed if self.completed else 0.0,
+        }
+
+
+password_hasher = PasswordHasher(Config.PASSWORD_HASH_WORKERS)
+
+
+async def generate_password_hash(password:str) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
+
+
+async def verify_password(password:str, hash:str) -> bool:
+    return await password_hasher.run(pwd_context.verify, password, hash)
+
+
+async def verify_and_update_password(password:str, hash:str) -> Tuple[bool, Optional[str]]:
+    """Verify a password, also returning a new hash when the stored one uses another bcrypt cost."""
+    return await password_hasher.run(pwd_context.verify_and_update, password, hash)
@@ -3,32 +3,38 @@ from .schemas import UserCreate, UserModel, UserLoginModel, UserBooksModel,Email
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.db import get_session  
 from .service import UserService
-from .utils import create_access_token,decode_token,verify_password, create_url_safe_token,decode_url_safe_token,generate_password_hash
+from .utils import create_access_token,decode_token, create_url_safe_token,decode_url_safe_token
+from .hashing import generate_password_hash, verify_and_update_password, password_hasher
 from datetime import timedelta
 from src.config import Config
 from fastapi.responses import JSONResponse
 from .dependencies import RefreshTokenBearer,AccessTokenBearer,get_current_user, RoleChecker
 from datetime import datetime
-from src.db.redis import add_jti_to_blocklist
+from src.db.redis import add_jti_to_blocklist, revoke_user_tokens, user_token_generation
 from src.errors import (UserAlreadyExists,UserNotFound,InvalidCredentials,InvalidToken,InvalidPassword)
-from src.mail import mail,create_message
 from src.config import Config
 from src.db.db import get_session
-from src.celery_tasks import send_email
+from src.celery_tasks import dispatch_emails
+from src.outbox import queue_email
+from src.ratelimit import RateLimiter
+from src.timing import TimedRoute
 
-auth_router = APIRouter()
+auth_router = APIRouter(route_class=TimedRoute, dependencies=[Depends(RateLimiter("auth", Config.AUTH_RATE_LIMIT))])
 
 user_service = UserService()
 
 role_checker = Depends(RoleChecker(['admin','user']))
 
+# Routes that check a password or send mail are also throttled per account, on top of the per-IP router limit
+credentials_rate_limit = Depends(RateLimiter("credentials", Config.CREDENTIALS_RATE_LIMIT, keys=("email",)))
+
 
 
 REFRESH_TOKEN_EXPIRY=2
 
 
 @auth_router.post("/send_mail")
-async def send_mail(emails:EmailModel):
+async def send_mail(emails:EmailModel, background_tasks:BackgroundTasks, session: AsyncSession = Depends(get_session)):
     emails = emails.addresses
     
     html = "<h1>Welcome to the App</h1>"
@@ -43,7 +49,11 @@ async def send_mail(emails:EmailModel):
     
     # await mail.send_message(message)
     
-    send_email.delay(receipients=emails,subject="Welcome to Bookly",body=html)
+    email = queue_email(session,recipients=emails,subject="Welcome to Bookly",body=html)
+    
+    await session.commit()
+    
+    background_tasks.add_task(dispatch_emails,[email.uid])
     
     return {"message":"Email sent successfully"}
 
@@ -51,7 +61,7 @@ async def send_mail(emails:EmailModel):
 
 
 
-@auth_router.post("/signup", status_code=status.HTTP_201_CREATED)
+@auth_router.post("/signup", status_code=status.HTTP_201_CREATED, dependencies=[credentials_rate_limit])
 async def create_user_account(user_data: UserCreate,background_tasks:BackgroundTasks, session: AsyncSession = Depends(get_session)):
     
     """ Create a new user account using email,username, first_name, last_name
@@ -66,8 +76,6 @@ async def create_user_account(user_data: UserCreate,background_tasks:BackgroundT
     if user_exists:
         raise UserAlreadyExists()
     
-    new_user = await user_service.create_user(user_data,session)
-    
     token = create_url_safe_token({"email":email})
     
     link = f"http://{Config.DOMAIN}/api/v1/auth/verify/{token}"
@@ -88,8 +96,12 @@ async def create_user_account(user_data: UserCreate,background_tasks:BackgroundT
     
     # background_tasks.add_task(mail.send_message,message)
     
-    send_email.delay(receipients=[email],subject="Verify your Email",body=html_message)
-
+    # The email is committed together with the user, and only dispatched once that commit succeeded
+    verification_email = queue_email(session,recipients=[email],subject="Verify your Email",body=html_message)
+    
+    new_user = await user_service.create_user(user_data,session)
+    
+    background_tasks.add_task(dispatch_emails,[verification_email.uid])
     
     return {
         "message":"Account Created Successfully! Check your email to verify your account",
@@ -124,7 +136,7 @@ async def verify_user_account(token:str, session: AsyncSession = Depends(get_ses
 
 
 
-@auth_router.post("/login")
+@auth_router.post("/login", dependencies=[credentials_rate_limit])
 async def login_user(login_data: UserLoginModel, session: AsyncSession = Depends(get_session)):
     """ Login a user using email and password"""
     email = login_data.email
@@ -133,15 +145,23 @@ async def login_user(login_data: UserLoginModel, session: AsyncSession = Depends
     user = await user_service.get_user_by_email(email,session)
     
     if user is not None:
-        password_valid = verify_password(password, user.password_hash)
+        password_valid, new_hash = await verify_and_update_password(password, user.password_hash)
         
         if password_valid:
+            if new_hash is not None:
+                # the stored hash predates the current BCRYPT_ROUNDS
+                await user_service.update_user(user,{"password_hash":new_hash},session)
+            
+            generation = await user_token_generation(str(user.uid))
+            
             access_token = create_access_token(
                 user_data={
                     'email':user.email,
                     'user_uid':str(user.uid),
                      "role":user.role
-                })
+                },
+                    generation=generation
+                )
 
             refresh_token = create_access_token(
                 user_data={
@@ -149,7 +169,8 @@ async def login_user(login_data: UserLoginModel, session: AsyncSession = Depends
                     'user_uid':str(user.uid)
                 },
                     refresh=True,
-                    expiry=timedelta(days=REFRESH_TOKEN_EXPIRY)
+                    expiry=timedelta(days=REFRESH_TOKEN_EXPIRY),
+                    generation=generation
                 )
         
             return JSONResponse(
@@ -175,7 +196,8 @@ async def get_new_access_token(token_details:dict = Depends(RefreshTokenBearer()
     
     if datetime.fromtimestamp(expiry_timestamp) > datetime.now():
         new_access_token = create_access_token(
-            user_data=token_details['user']
+            user_data=token_details['user'],
+            generation=token_details.get('gen', 0)
         )
         
         return JSONResponse(content={
@@ -186,17 +208,26 @@ async def get_new_access_token(token_details:dict = Depends(RefreshTokenBearer()
 
 
 @auth_router.get('/me', response_model=UserBooksModel, dependencies=[role_checker])
-async def get_current_user(user = Depends(get_current_user)):
+async def get_current_user(principal = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
     """ Get the current user using the access token"""
+    # the principal only carries identity, the profile needs the user with its books and reviews
+    user = await user_service.get_user_by_email(principal.email,session)
+    
     return user
     
 
+@auth_router.get('/hasher-stats', dependencies=[Depends(RoleChecker(['admin']))])
+async def get_hasher_stats() -> dict:
+    """ Queue depth and timings of the password hashing pool on this worker"""
+    return password_hasher.as_dict()
+    
+
 @auth_router.get('/logout')
 async def revooke_token(token_details: dict = Depends(AccessTokenBearer())):
     """ Revoke the access token using the jti"""
     jti = token_details['jti']
     
-    await add_jti_to_blocklist(jti)
+    await add_jti_to_blocklist(jti, token_details['exp'])
     
     return JSONResponse(
         content={
@@ -205,8 +236,8 @@ async def revooke_token(token_details: dict = Depends(AccessTokenBearer())):
         status_code=status.HTTP_200_OK
     )
 
-@auth_router.post("/password-rest-request")
-async def password_reset_request(email_data:PasswordResetRequestModel,session: AsyncSession = Depends(get_session)):
+@auth_router.post("/password-rest-request", dependencies=[credentials_rate_limit])
+async def password_reset_request(email_data:PasswordResetRequestModel,background_tasks:BackgroundTasks,session: AsyncSession = Depends(get_session)):
     email = email_data.email
     
     token = create_url_safe_token({"email":email})
@@ -220,9 +251,11 @@ async def password_reset_request(email_data:PasswordResetRequestModel,session: A
     <p>Please click this <a href="{link}">link</a> to Reset your password</p>
     """
     
-    message = create_message(recipients=[email],subject="Password Reset",body=html_message)
+    reset_email = queue_email(session,recipients=[email],subject="Password Reset",body=html_message)
     
-    await mail.send_message(message)
+    await session.commit()
+    
+    background_tasks.add_task(dispatch_emails,[reset_email.uid])
     
     return JSONResponse(
         content={
@@ -253,9 +286,12 @@ async def reset_account_password(token:str,passwords:PasswordResetConfirm, sessi
             raise UserNotFound()
         
         
-        password_hash = generate_password_hash(new_password)
+        password_hash = await generate_password_hash(new_password)
         await user_service.update_user(user,{"password_hash":password_hash},session)
         
+        # sessions opened with the old password end here
+        await revoke_user_tokens(str(user.uid))
+        
         return JSONResponse(
             content={"message":"Password Reset Successfully!"},
             status_code=status.HTTP_200_OK
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 import uuid
 from src.books.schemas import Book
 from typing import List
@@ -23,6 +23,15 @@ class UserModel(BaseModel):
     created_at: datetime
     updated_at: datetime
     
+class Principal(BaseModel):
+    """ The identity and permissions of an authenticated user, cached between requests"""
+    model_config = ConfigDict(frozen=True)
+    
+    uid: uuid.UUID
+    email: str
+    role: str
+    is_verified: bool
+    
 class UserBooksModel(UserModel):
     books: List[Book]
     reviews: List[ReviewModel]
@@ -2,7 +2,8 @@ from src.db.models import User
 from sqlmodel.ext.asyncio.session import  AsyncSession
 from sqlmodel import select
 from .schemas import UserCreate
-from .utils import generate_password_hash, verify_password
+from .hashing import generate_password_hash
+from .cache import invalidate_principal
 
 
 class UserService:
@@ -26,7 +27,7 @@ class UserService:
         
         new_user = User(**user_data_dict)
         
-        new_user.password_hash = generate_password_hash(user_data_dict["password"])
+        new_user.password_hash = await generate_password_hash(user_data_dict["password"])
         
         new_user.role = "user"
         
@@ -37,11 +38,16 @@ class UserService:
         return new_user
     
     async def update_user(self,user:User,user_data: dict, session:AsyncSession):
+        email = user.email
+        
         for k,v in user_data.items():
             setattr(user,k,v)
             
         await session.commit()
         
+        # role, verification and email are part of the cached principal
+        await invalidate_principal(email)
+        
         return user
         
         
\ No newline at end of file
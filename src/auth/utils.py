@@ -1,28 +1,21 @@
-from passlib.context import CryptContext  
 from datetime import timedelta, datetime  
 from src.config import Config
+from src.cache import LRUCache
+import hashlib
 import jwt
 import uuid
 import logging
 from itsdangerous import URLSafeTimedSerializer
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 ACCESS_TOKEN_EXPIRY = 3600
 
-# Password hashing and verification
-def generate_password_hash(password: str)-> str:
-    hash = pwd_context.hash(password)
-    return hash
-
-def verify_password(password:str, hash:str) -> bool:
-    return pwd_context.verify(password, hash)
-
 # ACCESS TOKEN
-def create_access_token(user_data:dict, expiry:timedelta = None, refresh:bool = False):
+def create_access_token(user_data:dict, expiry:timedelta = None, refresh:bool = False, generation:int = 0):
     payload = {}
     
     payload['user'] = user_data
+    # revoke_user_tokens invalidates every token issued with an older generation
+    payload['gen'] = generation
     payload['exp'] = datetime.now() + (expiry if expiry is not None else timedelta(seconds=ACCESS_TOKEN_EXPIRY))
     payload['jti'] = str(uuid.uuid4())
     payload['refresh'] = refresh
@@ -48,6 +41,26 @@ def decode_token(token:str) ->dict:
         logging.exception(e)
         return None
    
+# Payloads of verified tokens keyed by the token's sha256, each kept until the token expires
+verified_tokens = LRUCache(Config.TOKEN_CACHE_SIZE)
+
+def decode_cached_token(token:str) -> dict:
+    """Decode a token, skipping the signature check for tokens this worker already verified.
+    
+    The payload is shared between requests presenting the same token and must not be mutated.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    
+    token_data = verified_tokens.get(key)
+    
+    if token_data is None:
+        token_data = decode_token(token)
+        
+        if token_data is not None:
+            verified_tokens.set(key, token_data, expires_at=token_data['exp'])
+            
+    return token_data
+   
 serializer = URLSafeTimedSerializer(
         secret_key=Config.JWT_SECRET_KEY,
         salt="email-verification",
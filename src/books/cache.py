@@ -0,0 +1,97 @@
+from redis.exceptions import RedisError
+from src.db.redis import redis_client
+from src.config import Config
+from typing import Iterable, Optional
+import logging
+import uuid
+
+BOOK_DETAIL_PREFIX = "book_detail:"
+
+
+class CacheStats:
+    """Hit and miss counters of this worker's book detail cache."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+
+        return {
+            "hits":self.hits,
+            "misses":self.misses,
+            "errors":self.errors,
+            "hit_ratio":self.hits / lookups if lookups else 0.0
+        }
+
+
+book_cache_stats = CacheStats()
+
+
+def book_cache_key(book_uid) -> Optional[str]:
+    """Build the cache key from the canonical form of the uid so every spelling of it hits the same entry."""
+    try:
+        return f"{BOOK_DETAIL_PREFIX}{uuid.UUID(str(book_uid))}"
+
+    except ValueError:
+        return None
+
+
+async def get_cached_book(book_uid) -> Optional[str]:
+    """Return the serialized BookDetailModel of a book, or None on a miss."""
+    key = book_cache_key(book_uid)
+
+    if key is None:
+        return None
+
+    try:
+        payload = await redis_client.get(key)
+
+    except RedisError as e:
+        logging.warning("Book cache read failed: %s", e)
+        book_cache_stats.errors += 1
+        payload = None
+
+    if payload is None:
+        book_cache_stats.misses += 1
+        return None
+
+    book_cache_stats.hits += 1
+
+    return payload.decode() if isinstance(payload, bytes) else payload
+
+
+async def cache_book(book_uid, payload:str) -> None:
+    key = book_cache_key(book_uid)
+
+    if key is None:
+        return
+
+    try:
+        await redis_client.set(name=key, value=payload, ex=Config.BOOK_CACHE_TTL)
+
+    except RedisError as e:
+        logging.warning("Book cache write failed: %s", e)
+        book_cache_stats.errors += 1
+
+
+async def invalidate_books(book_uids:Iterable) -> None:
+    """Drop the cached details of the given books after they or their reviews and tags changed."""
+    keys = [key for key in map(book_cache_key, book_uids) if key is not None]
+
+    if not keys:
+        return
+
+    try:
+        await redis_client.delete(*keys)
+
+    except RedisError as e:
+        # the entries still expire after BOOK_CACHE_TTL
+        logging.error("Book cache invalidation failed: %s", e)
+        book_cache_stats.errors += 1
+
+
+async def invalidate_book(book_uid) -> None:
+    await invalidate_books([book_uid])
@@ -0,0 +1,221 @@
+from typing import AsyncIterator, Iterator, List, Tuple, Union
+from collections import deque
+from tempfile import SpooledTemporaryFile
+from src.config import Config
+import csv
+import json
+
+# Content types accepted by the bulk import endpoint
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_CONTENT_TYPES = ("text/csv",)
+
+# Reports above this size spill from memory to a temporary file
+REPORT_MEMORY_LIMIT = 1024 * 1024
+
+
+def import_format(content_type:str):
+    """Map the request content type to "ndjson" or "csv", or None when it is not supported."""
+    media_type = content_type.split(";")[0].strip().lower()
+
+    if media_type in NDJSON_CONTENT_TYPES:
+        return "ndjson"
+    if media_type in CSV_CONTENT_TYPES:
+        return "csv"
+
+    return None
+
+
+async def iter_line_batches(chunks:AsyncIterator[bytes]) -> AsyncIterator[List[Union[bytes, ValueError]]]:
+    """Split a byte stream into the complete lines available after each chunk.
+
+    A line longer than BOOKS_IMPORT_MAX_LINE_BYTES is replaced by a ValueError and its bytes
+    are dropped up to the next newline, so an upload without newlines is never buffered whole.
+    """
+    max_line_bytes = Config.BOOKS_IMPORT_MAX_LINE_BYTES
+    too_long = ValueError(f"Line is longer than {max_line_bytes} bytes")
+    parts, size, skipping = [], 0, False
+
+    async for chunk in chunks:
+        *ends, tail = chunk.split(b"\n")
+        lines = []
+
+        for end in ends:
+            if skipping or size + len(end) > max_line_bytes:
+                lines.append(too_long)
+            else:
+                parts.append(end)
+                lines.append(b"".join(parts))
+
+            parts, size, skipping = [], 0, False
+
+        if not skipping and tail:
+            parts.append(tail)
+            size += len(tail)
+
+            if size > max_line_bytes:
+                parts, size, skipping = [], 0, True
+
+        if lines:
+            yield lines
+
+    if skipping:
+        yield [too_long]
+    elif parts:
+        yield [b"".join(parts)]
+
+
+async def iter_decoded_lines(chunks:AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Union[str, ValueError]]]:
+    """Yield (line number, line) pairs, with the error in place of a line that is too long or not UTF-8."""
+    line_number = 0
+
+    async for raw_lines in iter_line_batches(chunks):
+        for raw_line in raw_lines:
+            line_number += 1
+
+            if isinstance(raw_line, ValueError):
+                yield line_number, raw_line
+                continue
+
+            try:
+                yield line_number, raw_line.decode("utf-8-sig")
+
+            except UnicodeDecodeError as e:
+                yield line_number, e
+
+
+class LineFeed:
+    """Input of a csv.reader that lives for the whole upload, refilled as lines arrive.
+
+    It stops iteration when it runs dry and remembers having done so, which tells the caller
+    the reader reached the end of the lines before the end of a record.
+    """
+
+    def __init__(self) -> None:
+        self.lines: deque = deque()
+        self.ran_dry = False
+
+    def refill(self, lines:List[str]) -> None:
+        self.lines = deque(lines)
+        self.ran_dry = False
+
+    def __iter__(self) -> "LineFeed":
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            self.ran_dry = True
+            raise StopIteration
+
+        return self.lines.popleft()
+
+
+async def iter_rows(chunks:AsyncIterator[bytes], format:str) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (line number, parsed row) pairs; a row that cannot be decoded or parsed is yielded as the exception."""
+    if format == "csv":
+        async for row in iter_csv_rows(chunks):
+            yield row
+        return
+
+    async for line_number, line in iter_decoded_lines(chunks):
+        if isinstance(line, ValueError):
+            yield line_number, line
+            continue
+
+        if not line.strip():
+            continue
+
+        try:
+            yield line_number, json.loads(line)
+
+        except ValueError as e:
+            yield line_number, e
+
+
+async def iter_csv_rows(chunks:AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (line number of the record's first line, row) pairs of a CSV upload with a header row.
+
+    One reader parses the whole upload and decides where each record ends, so quoted fields
+    may span lines and chunks. When it runs out of lines inside a quoted field, the record's
+    lines are kept and handed to it again once a line that could close the quote arrives. A
+    record the reader rejects is reported and parsing resumes at the next line.
+    """
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    fieldnames = None
+    record, record_line, quoted_size = [], 0, 0
+
+    async for line_number, line in iter_decoded_lines(chunks):
+        if isinstance(line, ValueError):
+            yield line_number, line
+            continue
+
+        if not record:
+            record_line = line_number
+
+        record.append(line + "\n")
+
+        if len(record) > 1:
+            # an unfinished record is inside a quoted field opened on its first line
+            quoted_size += len(line) + 1
+
+            if quoted_size > csv.field_size_limit():
+                yield record_line, ValueError(f"field larger than field limit ({csv.field_size_limit()})")
+                record, quoted_size = [], 0
+                continue
+
+            if '"' not in line:
+                continue
+
+        feed.refill(record)
+
+        try:
+            row = next(reader)
+
+        except csv.Error as e:
+            yield record_line, ValueError(str(e))
+            record, quoted_size = [], 0
+            continue
+
+        if feed.ran_dry:
+            continue
+
+        record, quoted_size = [], 0
+
+        if not row or not "".join(row).strip():
+            continue
+
+        if fieldnames is None:
+            fieldnames = [name.strip() for name in row]
+            continue
+
+        yield record_line, dict(zip(fieldnames, row))
+
+    if record:
+        yield record_line, ValueError("Quoted field is not closed before the end of the file")
+
+
+class ImportReport:
+    """NDJSON report of the rows an import rejected, followed by a summary line."""
+
+    def __init__(self) -> None:
+        self.file = SpooledTemporaryFile(max_size=REPORT_MEMORY_LIMIT)
+        self.inserted = 0
+        self.failed = 0
+
+    def add_error(self, line:int, errors:list) -> None:
+        self.failed += 1
+        self.write({"line":line, "errors":errors})
+
+    def write(self, entry:dict) -> None:
+        self.file.write(json.dumps(entry, default=str).encode() + b"\n")
+
+    def iter_content(self, chunk_size:int = 64 * 1024) -> Iterator[bytes]:
+        self.write({"inserted":self.inserted, "failed":self.failed})
+        self.file.seek(0)
+
+        try:
+            while chunk := self.file.read(chunk_size):
+                yield chunk
+
+        finally:
+            self.file.close()
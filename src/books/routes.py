@@ -1,29 +1,75 @@
-from fastapi import FastAPI, HTTPException, status, APIRouter, Depends
+from fastapi import FastAPI, HTTPException, status, APIRouter, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from typing import Optional,List
-from src.books.schemas import BookUpdateModel,Book,BookCreateModel,BookDetailModel
+from src.books.schemas import BookUpdateModel,Book,BookCreateModel,BookDetailModel,BookPageModel,BookFacetsModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.books.service import BookService
 from src.db.db import get_session
 from src.auth.dependencies import AccessTokenBearer,RoleChecker
+from src.books.cache import book_cache_stats
+from src.books.imports import import_format
+from src.exports import EXPORT_MEDIA_TYPES, stream_export
 from src.errors import BookNotFound
+from src.config import Config
+from src.ratelimit import RateLimiter
+from src.timing import TimedRoute
+from src.etags import compute_etag, etag_matches, not_modified, if_match_versions, version_etag
+import re
 
-book_router = APIRouter(tags=["Books"])
+book_router = APIRouter(route_class=TimedRoute, tags=["Books"], dependencies=[Depends(RateLimiter("books", Config.BOOKS_RATE_LIMIT))])
 book_service = BookService()
 access_token_bearer = AccessTokenBearer()
 role_checker = Depends(RoleChecker(['admin','user']))
+# the book's own version precedes those of its reviews and tags in a serialized BookDetailModel
+book_version = re.compile(r'"version":(\d+)')
 
-@book_router.get("/",response_model=List[Book], dependencies=[role_checker])
-async def get_all_books(session: AsyncSession = Depends(get_session), user_details=Depends(access_token_bearer)):
+page_size = Query(default=Config.BOOKS_PAGE_SIZE, ge=1, le=Config.BOOKS_MAX_PAGE_SIZE)
+export_format = Query(default="ndjson", pattern="^(ndjson|csv)$")
+sort_order = Query(default="created_at", pattern="^(created_at|rating)$")
+
+def book_page_etag(page:dict) -> str:
+    # every write to a book bumps its updated_at, so the watermarks identify the page content
+    return compute_etag(page["next_cursor"], *((book.uid, book.updated_at) for book in page["items"]))
+
+def book_filters(language:Optional[str] = None, author:Optional[str] = None, tag:Optional[str] = None) -> dict:
+    """ Browse filters shared by the book list and its facets"""
+    return {"language":language, "author":author, "tag":tag}
+
+@book_router.get("/",response_model=BookPageModel, dependencies=[role_checker])
+async def get_all_books(request:Request, response:Response, limit:int = page_size, cursor:Optional[str] = None, sort:str = sort_order, filters:dict = Depends(book_filters), session: AsyncSession = Depends(get_session), user_details=Depends(access_token_bearer)):
     print(user_details)
-    books = await book_service.get_all_books(session)
+    books = await book_service.get_all_books(session, limit=limit, cursor=cursor, sort=sort, filters=filters)
+    
+    etag = book_page_etag(books)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    response.headers["ETag"] = etag
     return books
 
 
 # Get a single user's book that he created.
-@book_router.get("/books/{user_uid}",response_model=List[Book], dependencies=[role_checker])
-async def get_user_book_submissions(user_uid: str,session: AsyncSession = Depends(get_session), user_details=Depends(access_token_bearer)):
+@book_router.get("/books/{user_uid}",response_model=BookPageModel, dependencies=[role_checker])
+async def get_user_book_submissions(user_uid: str,request:Request, response:Response,limit:int = page_size, cursor:Optional[str] = None, sort:str = sort_order,session: AsyncSession = Depends(get_session), user_details=Depends(access_token_bearer)):
     
-    books = await book_service.get_user_book_submissions(user_uid,session)
+    books = await book_service.get_user_book_submissions(user_uid,session, limit=limit, cursor=cursor, sort=sort)
+    
+    etag = book_page_etag(books)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    response.headers["ETag"] = etag
+    return books
+
+@book_router.get("/facets",response_model=BookFacetsModel, dependencies=[role_checker])
+async def get_book_facets(filters:dict = Depends(book_filters), session: AsyncSession = Depends(get_session), user_details=Depends(access_token_bearer)):
+    """ Book counts per language, author and tag for the given filters"""
+    facets = await book_service.get_book_facets(session, filters=filters, limit=Config.BOOK_FACET_LIMIT)
+    return facets
+
+@book_router.get("/search",response_model=BookPageModel, dependencies=[role_checker])
+async def search_books(q:str = Query(min_length=1, max_length=200), limit:int = page_size, cursor:Optional[str] = None, session: AsyncSession = Depends(get_session), user_details=Depends(access_token_bearer)):
+    books = await book_service.search_books(q, session, limit=limit, cursor=cursor)
     return books
 
 @book_router.post("/", status_code=status.HTTP_201_CREATED, response_model=Book,dependencies=[role_checker])
@@ -32,22 +78,62 @@ async def create_a_book(book_data:BookCreateModel, session:AsyncSession = Depend
     new_book = await book_service.create_book(user_uid=user_id,book_data=book_data, session=session)
     return new_book
 
+@book_router.post("/import", dependencies=[role_checker])
+async def import_books(request:Request, session:AsyncSession = Depends(get_session), token_details : dict=Depends(access_token_bearer)):
+    """ Bulk import books from an NDJSON or CSV request body.
+    
+    The response is an NDJSON report with one line per rejected row and a final
+    {"inserted": n, "failed": m} summary line.
+    """
+    format = import_format(request.headers.get("content-type", ""))
+    
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send the books as application/x-ndjson or text/csv"
+        )
+    
+    user_id = token_details.get("user")['user_uid']
+    report = await book_service.import_books(user_id, request.stream(), format, session)
+    
+    return StreamingResponse(report.iter_content(), media_type="application/x-ndjson")
+
+@book_router.get("/export", dependencies=[Depends(RoleChecker(['admin']))])
+async def export_books(format:str = export_format):
+    """ Stream the whole catalog as NDJSON or CSV"""
+    return StreamingResponse(
+        stream_export(lambda session: book_service.export_books(session, format)),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition":f'attachment; filename="books.{format}"'}
+    )
+
+@book_router.get("/cache-stats", dependencies=[Depends(RoleChecker(['admin']))])
+async def get_book_cache_stats() -> dict:
+    """ Hit and miss counters of the book detail cache on this worker"""
+    return book_cache_stats.as_dict()
+
 @book_router.get("/{book_uid}", response_model=BookDetailModel, dependencies=[role_checker])
-async def get_book(book_uid:str, session: AsyncSession = Depends(get_session), token_details : dict=Depends(access_token_bearer)) -> dict:
-    book = await book_service.get_book(book_uid, session)
+async def get_book(book_uid:str, request:Request, session: AsyncSession = Depends(get_session), token_details : dict=Depends(access_token_bearer)) -> dict:
+    # the cached payload is already a serialized BookDetailModel
+    book = await book_service.get_cached_book_details(book_uid, session)
     if book:
-        return book
+        etag = version_etag(int(book_version.search(book).group(1)), book)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        
+        return Response(content=book, media_type="application/json", headers={"ETag": etag})
     else:
         raise BookNotFound()
 
 
 @book_router.patch("/{book_uid}", status_code=status.HTTP_202_ACCEPTED,response_model=Book,dependencies=[role_checker])
-async def update_book(book_uid:str, book_update_data:BookUpdateModel, session:AsyncSession = Depends(get_session), token_details : dict=Depends(access_token_bearer)) -> dict:
-    updated_book = await book_service.update_book(book_uid, book_update_data,session)
+async def update_book(book_uid:str, book_update_data:BookUpdateModel, response:Response, versions:Optional[List[int]] = Depends(if_match_versions), session:AsyncSession = Depends(get_session), token_details : dict=Depends(access_token_bearer)) -> dict:
+    updated_book = await book_service.update_book(book_uid, book_update_data,session, versions=versions)
     
     if updated_book is None:
         raise BookNotFound()
     else:
+        response.headers["ETag"] = version_etag(updated_book.version)
         return updated_book
 
 
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 import uuid
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from src.reviews.schemas import ReviewModel
 from src.tags.schemas import TagModel
@@ -13,6 +13,9 @@ class Book(BaseModel):
         published_date:datetime
         page_count:int
         language:str
+        review_count:int
+        average_rating:float
+        version:int
         created_at:datetime
         updated_at:datetime
         
@@ -20,6 +23,19 @@ class BookDetailModel(Book):
         reviews: List[ReviewModel]
         tags: List[TagModel]
         
+class BookPageModel(BaseModel):
+        items: List[Book]
+        next_cursor: Optional[str] = None
+
+class FacetCountModel(BaseModel):
+        value:str
+        count:int
+
+class BookFacetsModel(BaseModel):
+        language: List[FacetCountModel]
+        author: List[FacetCountModel]
+        tag: List[FacetCountModel]
+
 class BookCreateModel(BaseModel):
         title:str
         author:str
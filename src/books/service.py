@@ -1,23 +1,241 @@
 from sqlmodel.ext.asyncio.session import AsyncSession
-from .schemas import BookCreateModel, BookUpdateModel
-from sqlmodel import select,desc
-from src.db.models import Book
+from .schemas import BookCreateModel, BookUpdateModel, BookDetailModel
+from .cache import get_cached_book, cache_book, invalidate_book, invalidate_books
+from .imports import ImportReport, iter_rows
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError, DBAPIError
+from src.config import Config
+from src.exports import stream_rows
+from sqlmodel import select,desc,insert,update,delete
+from sqlalchemy import tuple_, func, or_, literal, cast, Float, text
+from sqlalchemy.orm import selectinload
+from src.db.models import Book, BookTag, Tag
+from src.db.operations import update_entity
+from src.errors import InvalidCursor
+from src.pagination import encode_cursor, decode_cursor
 from datetime import datetime
+from typing import Optional, AsyncIterator, List
+import logging
+import uuid
+
+# Text search configuration used by the generated books.search_vector column
+SEARCH_CONFIG = "simple"
+
+# Keyset columns of each book list ordering, matching the composite indexes on books
+SORT_KEYS = {
+    "created_at":(Book.created_at, Book.uid),
+    "rating":(Book.average_rating, Book.created_at, Book.uid),
+}
 
 class BookService:
-    async def get_all_books(self,session:AsyncSession):
-        statement = select(Book).order_by(desc(Book.created_at))
+    # Whether pg_trgm is installed, looked up on the first search that needs it
+    trigram_available: Optional[bool] = None
+    
+    async def get_all_books(self,session:AsyncSession, limit:int, cursor:Optional[str] = None, sort:str = "created_at", filters:Optional[dict] = None):
+        statement = select(Book).where(*self.book_filters(**(filters or {})))
+        
+        return await self.paginate_books(statement, limit, cursor, session, sort)
+    
+    def book_filters(self,language:Optional[str] = None, author:Optional[str] = None, tag:Optional[str] = None) -> list:
+        """Build the WHERE clauses of the browse filters that were given."""
+        conditions = []
+        
+        if language is not None:
+            conditions.append(Book.language == language)
+            
+        if author is not None:
+            conditions.append(Book.author == author)
+            
+        if tag is not None:
+            tagged_books = select(BookTag.book_uid).join(Tag, Tag.uid == BookTag.tag_uid).where(Tag.name == tag)
+            conditions.append(Book.uid.in_(tagged_books))
+            
+        return conditions
+    
+    async def get_book_facets(self,session:AsyncSession, filters:Optional[dict] = None, limit:int = 50):
+        """Count the books per language, author and tag in one GROUPING SETS query.
+        
+        The counts honour the active filters, so they show how many books each further refinement leaves.
+        Each facet is ranked in the database, which only returns its top limit values.
+        """
+        facet_columns = {"language":Book.language, "author":Book.author, "tag":Tag.name}
+        
+        counts = (
+            select(
+                *facet_columns.values(),
+                *(func.grouping(column).label(f"grouping_{name}") for name, column in facet_columns.items()),
+                func.count(func.distinct(Book.uid)).label("count")
+            )
+            .select_from(Book)
+            .outerjoin(BookTag, BookTag.book_uid == Book.uid)
+            .outerjoin(Tag, Tag.uid == BookTag.tag_uid)
+            .where(*self.book_filters(**(filters or {})))
+            .group_by(func.grouping_sets(*(tuple_(column) for column in facet_columns.values())))
+            .subquery("counts")
+        )
+        
+        # only the grouped column is set in each row; books without tags show up as a NULL tag
+        value = func.coalesce(*(counts.c[column.name] for column in facet_columns.values()))
+        grouping = [counts.c[f"grouping_{name}"] for name in facet_columns]
+        
+        ranked = (
+            select(
+                *grouping,
+                value.label("value"),
+                counts.c.count,
+                func.row_number().over(partition_by=grouping, order_by=(desc(counts.c.count), value)).label("rank")
+            )
+            .where(value.is_not(None))
+            .subquery("ranked")
+        )
+        
+        statement = (
+            select(*(ranked.c[f"grouping_{name}"] for name in facet_columns), ranked.c.value, ranked.c.count)
+            .where(ranked.c.rank <= limit)
+            .order_by(ranked.c.rank)
+        )
+        
         result = await session.exec(statement)
         
-        return result.all()
+        facets = {name:[] for name in facet_columns}
+        
+        for *grouping_flags, value, count in result.all():
+            # grouping() is 0 for the column the row's grouping set aggregates on
+            name = list(facet_columns)[grouping_flags.index(0)]
+            facets[name].append({"value":value, "count":count})
+            
+        return facets
+    
     
+    async def get_user_book_submissions(self,user_uid:str,session:AsyncSession, limit:int, cursor:Optional[str] = None, sort:str = "created_at"):
+        statement = select(Book).where(Book.user_uid == user_uid)
+        
+        return await self.paginate_books(statement, limit, cursor, session, sort)
     
-    async def get_user_book_submissions(self,user_uid:str,session:AsyncSession):
-        statement = select(Book).where(Book.user_uid == user_uid).order_by(desc(Book.created_at))
+    async def paginate_books(self,statement, limit:int, cursor:Optional[str], session:AsyncSession, sort:str = "created_at"):
+        """Return one page of books in descending sort key order, seeking past the key in the cursor.
+        
+        Seeking on the composite index keeps every page as cheap as the first one, unlike OFFSET.
+        """
+        sort_columns = SORT_KEYS[sort]
+        
+        if cursor is not None:
+            key = self.decode_book_cursor(cursor, sort)
+            statement = statement.where(tuple_(*sort_columns) < tuple_(*key))
+            
+        # fetch one extra row to find out whether there is a next page
+        statement = statement.order_by(*(desc(column) for column in sort_columns)).limit(limit + 1)
         result = await session.exec(statement)
         
-        return result.all()
+        books = result.all()
+        next_cursor = None
+        
+        if len(books) > limit:
+            books = books[:limit]
+            last_book = books[-1]
+            next_cursor = encode_cursor({
+                "sort":sort,
+                "average_rating":last_book.average_rating,
+                "created_at":last_book.created_at.isoformat(),
+                "uid":str(last_book.uid)
+            })
+            
+        return {"items":books, "next_cursor":next_cursor}
     
+    async def search_books(self,query:str, session:AsyncSession, limit:int, cursor:Optional[str] = None):
+        """Rank books matching the query on title, author and publisher.
+        
+        Full-text matches come first; when a query has none (typos, partial words) the
+        search falls back to pg_trgm word similarity on title and author, if the
+        extension is installed.
+        """
+        mode, after = "fts", None
+        
+        if cursor is not None:
+            mode, after = self.decode_search_cursor(cursor)
+            
+        page = await self.search_page(mode, query, limit, after, session)
+        
+        if mode == "fts" and after is None and not page["items"] and await self.trigram_search_available(session):
+            page = await self.search_page("trgm", query, limit, None, session)
+            
+        return page
+    
+    async def trigram_search_available(self,session:AsyncSession) -> bool:
+        """Whether pg_trgm, installed by the search migration, is there for the fuzzy fallback; checked once."""
+        if self.trigram_available is None:
+            try:
+                # a savepoint, so a failed check does not abort the request's transaction
+                async with session.begin_nested():
+                    result = await session.exec(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+                    BookService.trigram_available = result.first() is not None
+                    
+            except DBAPIError as e:
+                logging.warning("Could not check for pg_trgm: %s", e)
+                BookService.trigram_available = False
+                
+            if not self.trigram_available:
+                logging.warning("pg_trgm is not installed, book search has no typo-tolerant fallback")
+                
+        return self.trigram_available
+    
+    async def search_page(self,mode:str, query:str, limit:int, after, session:AsyncSession):
+        if mode == "fts":
+            search_vector = Book.__table__.c.search_vector
+            ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+            score = func.ts_rank(search_vector, ts_query)
+            condition = search_vector.op("@@")(ts_query)
+        else:
+            score = func.greatest(func.word_similarity(query, Book.title), func.word_similarity(query, Book.author))
+            condition = or_(literal(query).op("<%")(Book.title), literal(query).op("<%")(Book.author))
+            
+        statement = select(Book, score.label("score")).where(condition)
+        
+        if after is not None:
+            statement = statement.where(tuple_(score, Book.uid) < tuple_(*after))
+            
+        statement = statement.order_by(desc(score), desc(Book.uid)).limit(limit + 1)
+        result = await session.exec(statement)
+        
+        rows = result.all()
+        next_cursor = None
+        
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_book, last_score = rows[-1]
+            next_cursor = encode_cursor({"mode":mode, "score":last_score, "uid":str(last_book.uid)})
+            
+        return {"items":[book for book, _ in rows], "next_cursor":next_cursor}
+    
+    def decode_search_cursor(self,cursor:str):
+        data = decode_cursor(cursor)
+        
+        try:
+            if data["mode"] not in ("fts", "trgm"):
+                raise InvalidCursor()
+            
+            return data["mode"], (float(data["score"]), uuid.UUID(data["uid"]))
+        
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidCursor() from e
+    
+    def decode_book_cursor(self,cursor:str, sort:str = "created_at"):
+        data = decode_cursor(cursor)
+        
+        try:
+            if data.get("sort", "created_at") != sort:
+                raise InvalidCursor()
+            
+            key = (datetime.fromisoformat(data["created_at"]), uuid.UUID(data["uid"]))
+            
+            if sort == "rating":
+                key = (float(data["average_rating"]), *key)
+                
+            return key
+        
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidCursor() from e
+        
     async def get_book(self,book_uid:str, session:AsyncSession):
         statement = select(Book).where(Book.uid == book_uid)
         result = await session.exec(statement)
@@ -25,12 +243,46 @@ class BookService:
         book = result.first()
         
         return book if book is not None else None
+    
+    async def get_book_details(self,book_uid:str, session:AsyncSession):
+        """Get a book together with the reviews and tags rendered by BookDetailModel."""
+        statement = select(Book).where(Book.uid == book_uid).options(
+            selectinload(Book.reviews),
+            selectinload(Book.tags)
+        )
+        result = await session.exec(statement)
+        
+        return result.first()
 
     
+    def export_books(self,session:AsyncSession, format:str):
+        """Stream every book as NDJSON or CSV."""
+        statement = select(*Book.__mapper__.columns)
+        
+        return stream_rows(session, statement, format)
+    
+    async def get_cached_book_details(self,book_uid:str, session:AsyncSession) -> Optional[str]:
+        """Get the BookDetailModel JSON of a book through the Redis read-through cache."""
+        payload = await get_cached_book(book_uid)
+        
+        if payload is not None:
+            return payload
+        
+        book = await self.get_book_details(book_uid, session)
+        
+        if book is None:
+            return None
+        
+        payload = BookDetailModel.model_validate(book, from_attributes=True).model_dump_json()
+        
+        await cache_book(book_uid, payload)
+        
+        return payload
+
     async def create_book(self,user_uid, book_data:BookCreateModel,session:AsyncSession) :
         book_data_dict = book_data.model_dump()
         new_book = Book(**book_data_dict)
-        new_book.published_date = datetime.strptime(book_data_dict['published_date'], "%Y-%m-%d")
+        new_book.published_date = datetime.fromisoformat(book_data_dict['published_date'])
         
         new_book.user_uid = user_uid
         
@@ -41,31 +293,122 @@ class BookService:
         return new_book        
         
     
-    async def update_book(self,book_uid:str,update_data:BookUpdateModel, session:AsyncSession):
-        book_to_update = await self.get_book(book_uid,session)
+    async def update_book(self,book_uid:str,update_data:BookUpdateModel, session:AsyncSession, versions:Optional[List[int]] = None):
+        book, previous = await update_entity(session, Book, book_uid, update_data.model_dump(), versions)
         
-        if book_to_update is not None:
-        
-            update_data_dict = update_data.model_dump()
-            
-            for key, value in update_data_dict.items():
-                setattr(book_to_update,key,value)
-                
+        if previous is not None:
             await session.commit()
             
-            return book_to_update
-        else:
-            return None
+            await invalidate_book(book_uid)
+            
+        return book
             
     async def delete_book(self,book_uid:str,session:AsyncSession):
-        book_to_delete = await self.get_book(book_uid,session)
+        """Delete a book in one statement; its reviews and tag links go with it through ON DELETE CASCADE."""
+        result = await session.exec(delete(Book).where(Book.uid == book_uid).returning(Book.uid))
         
-        if book_to_delete is not None:
-            await session.delete(book_to_delete)
-            await session.commit()
-            
-            return {}
-        else :
+        if result.first() is None:
             return None
+        
+        await session.commit()
+        
+        await invalidate_book(book_uid)
+        
+        return {}
+        
+    async def import_books(self,user_uid, chunks:AsyncIterator[bytes], format:str, session:AsyncSession) -> ImportReport:
+        """Validate and insert books streamed as NDJSON or CSV rows.
+        
+        Valid rows are inserted in multi-row INSERTs of BOOKS_IMPORT_BATCH_SIZE, each batch in
+        its own transaction. Rejected rows are written to the returned report, so neither the
+        upload nor the report is held in memory.
+        """
+        report = ImportReport()
+        batch, batch_lines = [], []
+        
+        async for line, row in iter_rows(chunks, format):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                
+                book_data = BookCreateModel.model_validate(row)
+                book_data_dict = book_data.model_dump()
+                book_data_dict['published_date'] = datetime.fromisoformat(book_data.published_date)
+                
+            except ValidationError as e:
+                report.add_error(line, e.errors(include_url=False, include_context=False, include_input=False))
+                continue
+                
+            except ValueError as e:
+                report.add_error(line, [{"msg":str(e)}])
+                continue
+            
+            book_data_dict['user_uid'] = user_uid
+            batch.append(book_data_dict)
+            batch_lines.append(line)
+            
+            if len(batch) >= Config.BOOKS_IMPORT_BATCH_SIZE:
+                await self.insert_book_batch(batch, batch_lines, report, session)
+                batch, batch_lines = [], []
+                
+        if batch:
+            await self.insert_book_batch(batch, batch_lines, report, session)
+            
+        return report
     
-    
\ No newline at end of file
+    async def insert_book_batch(self,batch:list, batch_lines:list, report:ImportReport, session:AsyncSession):
+        try:
+            await session.exec(insert(Book), params=batch)
+            await session.commit()
+            
+            report.inserted += len(batch)
+            
+        except SQLAlchemyError as e:
+            logging.exception("Error importing books: %s", e)
+            await session.rollback()
+            
+            for line in batch_lines:
+                report.add_error(line, [{"msg":"The batch containing this row could not be saved"}])
+                
+    async def update_rating_aggregates(self,book_uid, count_delta:int, rating_delta:int, session:AsyncSession):
+        """Apply a review insert, update or delete to the book's aggregates without committing.
+        
+        The increments are relative, so concurrent review writes on the same book do not lose updates.
+        """
+        statement = update(Book).where(Book.uid == book_uid).values(
+            review_count=Book.review_count + count_delta,
+            rating_sum=Book.rating_sum + rating_delta,
+            average_rating=cast(Book.rating_sum + rating_delta, Float) / func.greatest(Book.review_count + count_delta, 1)
+        ).execution_options(synchronize_session=False)
+        
+        await session.exec(statement)
+        
+    async def reconcile_rating_aggregates(self,session:AsyncSession) -> int:
+        """Recompute the aggregates from the review table and fix the books that drifted.
+        
+        Returns the number of books that were corrected. A raw UPDATE skips the column's
+        onupdate, so updated_at is set here for the list ETags that are built from it.
+        """
+        statement = text("""
+            UPDATE books
+            SET review_count = actual.review_count,
+                rating_sum = actual.rating_sum,
+                average_rating = actual.rating_sum::float / greatest(actual.review_count, 1),
+                updated_at = :updated_at
+            FROM (
+                SELECT books.uid, count(review.uid) AS review_count, coalesce(sum(review.rating), 0) AS rating_sum
+                FROM books LEFT JOIN review ON review.book_uid = books.uid
+                GROUP BY books.uid
+            ) AS actual
+            WHERE books.uid = actual.uid
+              AND (books.review_count <> actual.review_count OR books.rating_sum <> actual.rating_sum)
+            RETURNING books.uid
+        """).bindparams(updated_at=datetime.now())
+        
+        result = await session.exec(statement)
+        corrected = result.scalars().all()
+        await session.commit()
+        
+        await invalidate_books(corrected)
+        
+        return len(corrected)
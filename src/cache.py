@@ -0,0 +1,50 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import time
+
+
+class LRUCache:
+    """Bounded in-process cache whose entries also expire at their own deadline.
+
+    Deadlines are epoch seconds, so they can come straight from a JWT exp claim.
+    The least recently used entry is evicted once maxsize entries are held.
+    """
+
+    def __init__(self, maxsize:int) -> None:
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key:Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+
+        return value
+
+    def set(self, key:Hashable, value:Any, expires_at:float) -> None:
+        if self.maxsize <= 0:
+            return
+
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def delete(self, key:Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -1,22 +1,182 @@
 from celery import Celery
-from src.mail import create_message,mail
-from asgiref.sync import async_to_sync
+from src.mail import build_message, smtp_pool
+from src.db.db import Session
+from src.books.service import BookService
+from src.outbox import claim_email, mark_sent, release_email, pending_emails, outbox_message_id
+from src.config import Config
+from kombu.exceptions import OperationalError
+from typing import Optional
+import asyncio
+import logging
+import os
+import threading
 
 c_app = Celery()
 c_app.config_from_object('src.config')
 
 
-@c_app.task()
-def send_email(receipients:list[str], subject:str, body:str):
+class WorkerLoop:
+    """One event loop per worker process, running in a background thread.
+    
+    Tasks submit coroutines to it instead of starting a loop per run, so the SMTP pool
+    and the database engine keep their connections between tasks. The loop is created
+    lazily and again after a fork, since prefork children must not share the parent's.
+    """
+    
+    def __init__(self) -> None:
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pid: Optional[int] = None
+        self.lock = threading.Lock()
+        
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                self.loop = asyncio.new_event_loop()
+                self.pid = os.getpid()
+                threading.Thread(target=self.loop.run_forever, name="celery-loop", daemon=True).start()
+                
+            return self.loop
+        
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+
+
+worker_loop = WorkerLoop()
+
+
+def retry_countdown(retries:int) -> int:
+    return min(2 ** retries * 5, Config.MAIL_RETRY_BACKOFF_MAX)
+
+
+@c_app.task(bind=True, max_retries=Config.MAIL_MAX_RETRIES)
+def send_email(self, receipients:list[str], subject:str, body:str):
     """
     Send email using Celery task.
     """
     
-    message = create_message(recipients=receipients,subject=subject,body=body)
+    message = build_message(recipients=receipients,subject=subject,body=body)
     
-    async_to_sync(mail.send_message)(message)
+    unsent, error = worker_loop.run(smtp_pool.send([message]))
+    
+    if unsent:
+        raise self.retry(exc=error, countdown=retry_countdown(self.request.retries))
     
     print("Email sent")
+
+
+async def send_batches(recipients:list[str], subject:str, body:str) -> list[str]:
+    """Send one message per recipient, SMTP_BATCH_SIZE messages per pooled connection.
+    
+    Returns the recipients left unsent by a transient failure.
+    """
+    batches = [
+        [build_message(recipients=[recipient],subject=subject,body=body) for recipient in recipients[start:start + Config.SMTP_BATCH_SIZE]]
+        for start in range(0, len(recipients), Config.SMTP_BATCH_SIZE)
+    ]
+    
+    results = await asyncio.gather(*(smtp_pool.send(batch) for batch in batches))
+    
+    for _, error in results:
+        if error is not None:
+            logging.warning("Bulk email batch interrupted: %r", error)
+            
+    return [message["To"] for unsent, _ in results for message in unsent]
+
+
+@c_app.task(bind=True, max_retries=Config.MAIL_MAX_RETRIES)
+def send_bulk_email(self, recipients:list[str], subject:str, body:str):
+    """
+    Send the same email to many recipients, each getting their own message.
+    """
+    
+    unsent = worker_loop.run(send_batches(recipients, subject, body))
+    
+    if unsent:
+        # only the recipients that were not reached are retried
+        raise self.retry(args=(unsent, subject, body), countdown=retry_countdown(self.request.retries))
+    
+    print(f"Bulk email sent to {len(recipients)} recipients")
+
+
+async def send_outbox(uid:str) -> Optional[Exception]:
+    """Send one outbox email unless it was already sent, returning the error of a transient failure."""
+    async with Session() as session:
+        email = await claim_email(session, uid)
+        
+        if email is None:
+            return None
+        
+        try:
+            unsent, error = await smtp_pool.send([build_message(recipients=email.recipients,subject=email.subject,body=email.body,message_id=outbox_message_id(email.uid))])
+            
+        except BaseException:
+            await release_email(session, uid)
+            raise
+        
+        if unsent:
+            await release_email(session, uid)
+            return error
+        
+        await mark_sent(session, uid)
+        
+        return None
+
+
+@c_app.task(bind=True, max_retries=Config.MAIL_MAX_RETRIES)
+def send_outbox_email(self, uid:str):
+    """
+    Send an email queued in the outbox once however often it is dispatched, unless a worker dies
+    between the SMTP hand-off and mark_sent: delivery is at least once, and a resend carries the
+    same Message-ID.
+    """
+    error = worker_loop.run(send_outbox(uid))
+    
+    if error is not None:
+        raise self.retry(exc=error, countdown=retry_countdown(self.request.retries))
+
+
+def dispatch_emails(uids:list) -> None:
+    """Hand committed outbox emails to the worker; meant to run as a background task after the response.
+    
+    When the broker is unreachable the emails stay in the outbox for dispatch_pending_emails.
+    """
+    for uid in uids:
+        try:
+            send_outbox_email.delay(str(uid))
+            
+        except OperationalError as e:
+            logging.warning("Outbox email %s left for the sweep, broker unavailable: %r", uid, e)
+
+
+async def pending_outbox_emails() -> list:
+    async with Session() as session:
+        return await pending_emails(session)
+
+
+@c_app.task()
+def dispatch_pending_emails():
+    """
+    Dispatch outbox emails whose dispatch after commit never reached the worker.
+    """
+    uids = worker_loop.run(pending_outbox_emails())
+    
+    dispatch_emails(uids)
+    
+    return len(uids)
+
+
+async def reconcile_book_ratings() -> int:
+    async with Session() as session:
+        return await BookService().reconcile_rating_aggregates(session)
+
+
+@c_app.task()
+def reconcile_rating_aggregates():
+    """
+    Fix books whose review aggregates drifted from the review table.
+    """
+    corrected = worker_loop.run(reconcile_book_ratings())
     
+    print(f"Reconciled rating aggregates of {corrected} books")
     
-    
\ No newline at end of file
+    return corrected
@@ -17,6 +17,54 @@ class Settings(BaseSettings):
     USE_CREDENTIALS:bool = True
     VALIDATE_CERTS:bool = True
     DOMAIN:str
+    BOOKS_PAGE_SIZE:int = 20
+    BOOKS_MAX_PAGE_SIZE:int = 100
+    BOOK_FACET_LIMIT:int = 50
+    BOOK_CACHE_TTL:int = 300
+    BOOKS_IMPORT_BATCH_SIZE:int = 1000
+    BOOKS_IMPORT_MAX_LINE_BYTES:int = 64 * 1024
+    RATING_RECONCILE_INTERVAL:int = 3600
+    BCRYPT_ROUNDS:int = 12
+    PASSWORD_HASH_WORKERS:int = 4
+    TOKEN_CACHE_SIZE:int = 10000
+    BLOCKLIST_RESYNC_DELAY:int = 5
+    # Seconds without a reply before an idle Redis connection is pinged
+    REDIS_HEALTH_CHECK_INTERVAL:int = 15
+    PRINCIPAL_CACHE_TTL:int = 300
+    PRINCIPAL_LOCAL_TTL:int = 5
+    # Rate limits as "<requests>/<second|minute|hour|day>", empty to disable
+    AUTH_RATE_LIMIT:str = "60/minute"
+    CREDENTIALS_RATE_LIMIT:str = "5/minute"
+    BOOKS_RATE_LIMIT:str = ""
+    REVIEWS_RATE_LIMIT:str = ""
+    TAGS_RATE_LIMIT:str = ""
+    RATE_LIMIT_REDIS_TIMEOUT:float = 0.25
+    # Proxies whose X-Forwarded-For gives the client IP, comma separated; "*" behind Render's proxy
+    FORWARDED_ALLOW_IPS:str = "127.0.0.1"
+    # Clients allowed to scrape /metrics, comma separated; others need "Bearer <METRICS_TOKEN>"
+    METRICS_ALLOW_IPS:str = "127.0.0.1"
+    METRICS_TOKEN:str = ""
+    SMTP_POOL_SIZE:int = 4
+    SMTP_BATCH_SIZE:int = 50
+    SMTP_IDLE_TIMEOUT:int = 60
+    MAIL_MAX_RETRIES:int = 5
+    MAIL_RETRY_BACKOFF_MAX:int = 600
+    OUTBOX_CLAIM_TIMEOUT:int = 300
+    OUTBOX_SWEEP_INTERVAL:int = 60
+    OUTBOX_SWEEP_DELAY:int = 30
+    OUTBOX_SWEEP_BATCH:int = 500
+    OUTBOX_MAX_ATTEMPTS:int = 10
+    # Share of successful requests written to the access log; errors and slow requests always are
+    ACCESS_LOG_SAMPLE_RATE:float = 1.0
+    ACCESS_LOG_SLOW_MS:float = 1000
+    # Development aid: per-request query counts in response headers and N+1 warnings
+    DB_QUERY_HEADERS:bool = False
+    N_PLUS_ONE_THRESHOLD:int = 5
+    # Per-phase Server-Timing header (auth, blocklist, principal, sql, handler, serialize)
+    SERVER_TIMING:bool = False
+    # Admin X-Profile requests profiled per worker, empty to disable; needs pyinstrument
+    PROFILE_RATE_LIMIT:str = "6/minute"
+    PROFILE_INTERVAL:float = 0.001
         
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -27,4 +75,15 @@ Config = Settings()
 
 broker_url = Config.REDIS_URL
 result_backend = Config.REDIS_URL
-broker_connection_retry_on_startup = True
\ No newline at end of file
+broker_connection_retry_on_startup = True
+
+beat_schedule = {
+    "reconcile-rating-aggregates":{
+        "task":"src.celery_tasks.reconcile_rating_aggregates",
+        "schedule":Config.RATING_RECONCILE_INTERVAL,
+    },
+    "dispatch-pending-emails":{
+        "task":"src.celery_tasks.dispatch_pending_emails",
+        "schedule":Config.OUTBOX_SWEEP_INTERVAL,
+    },
+}
\ No newline at end of file
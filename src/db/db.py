@@ -30,13 +30,14 @@ async def init_db():
         await conn.run_sync(SQLModel.metadata.create_all)
         
 
+# Session factory, also used directly by code that outlives the request dependencies (e.g. streamed responses)
+Session = sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
 # define session
 async def get_session() -> AsyncSession:
-    Session = sessionmaker(
-        bind=engine,
-        class_=AsyncSession,
-        expire_on_commit=False
-    )
-    
     async with Session() as session:
         yield session
\ No newline at end of file
@@ -1,5 +1,6 @@
 from sqlmodel import Field, SQLModel,Field,Column,Relationship
 import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy import Index, Computed, text
 from typing import List
 import uuid
 from datetime import datetime
@@ -17,14 +18,15 @@ class User(SQLModel, table=True):
             default=uuid.uuid4
         ))
     username: str
-    email:str
+    # Looked up on every authenticated request and assumed unique by signup
+    email:str = Field(unique=True, index=True)
     first_name: str
     last_name: str
     role : str  = Field(sa_column=Column(pg.VARCHAR, nullable=False, server_default="user"))
     is_verified:bool = Field(default=False)
     password_hash: str = Field(exclude=True)
     created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
-    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now, onupdate=datetime.now))
     # Relationship with the Book model
     books : List["Book"] = Relationship(back_populates="user", sa_relationship_kwargs={'lazy':'selectin'} )
     # Relationship with the Review model
@@ -39,12 +41,26 @@ class User(SQLModel, table=True):
         return f"<User {self.username}>"
 
 class BookTag(SQLModel, table=True): 
-    book_uid: uuid.UUID = Field(foreign_key="books.uid", primary_key=True)
-    tag_uid: uuid.UUID = Field(foreign_key="tags.uid", primary_key=True)
+    # The primary key only serves lookups by book, this one serves tag filters and facets
+    __table_args__ = (
+        Index("ix_booktag_tag_uid_book_uid", "tag_uid", "book_uid"),
+    )
+    
+    book_uid: uuid.UUID = Field(foreign_key="books.uid", primary_key=True, ondelete="CASCADE")
+    tag_uid: uuid.UUID = Field(foreign_key="tags.uid", primary_key=True, ondelete="CASCADE")
 
 
 class Book(SQLModel, table=True):
     __tablename__ = "books"
+    # Composite indexes backing the keyset pagination of the book lists
+    __table_args__ = (
+        Index("ix_books_created_at_uid", "created_at", "uid"),
+        Index("ix_books_user_uid_created_at_uid", "user_uid", "created_at", "uid"),
+        Index("ix_books_average_rating_created_at_uid", "average_rating", "created_at", "uid"),
+        # Language and author filters and facet counts, with the list keyset as the tail
+        Index("ix_books_language_created_at_uid", "language", "created_at", "uid"),
+        Index("ix_books_author_created_at_uid", "author", "created_at", "uid"),
+    )
     
     uid: uuid.UUID = Field(
         sa_column=Column(
@@ -60,13 +76,20 @@ class Book(SQLModel, table=True):
     page_count:int
     language:str
     user_uid: Optional[uuid.UUID] = Field(default= None, foreign_key="users.uid")
+    # Review aggregates, maintained by ReviewService in the same transaction as the review writes
+    review_count:int = Field(default=0, sa_column_kwargs={"server_default":"0"})
+    rating_sum:int = Field(default=0, sa_column_kwargs={"server_default":"0"})
+    average_rating:float = Field(default=0.0, sa_column_kwargs={"server_default":"0"})
+    # Bumped by every update, checked against If-Match for optimistic concurrency
+    version:int = Field(default=1, sa_column_kwargs={"server_default":"1"})
     created_at:datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
-    updated_at:datetime = Field(sa_column=Column(pg.TIMESTAMP,default=datetime.now))
+    updated_at:datetime = Field(sa_column=Column(pg.TIMESTAMP,default=datetime.now, onupdate=datetime.now))
     # Relationship with the user model
     user : Optional["User"] = Relationship(back_populates="books")
     # Relationship with the review model
-    reviews : List["Review"] = Relationship(back_populates="book",sa_relationship_kwargs={'lazy':'selectin'})
-    tags : List["Tag"] = Relationship(link_model=BookTag,back_populates="books", sa_relationship_kwargs={'lazy':'selectin'})    
+    # Reviews and tag links are removed by ON DELETE CASCADE, so deletes never load them
+    reviews : List["Review"] = Relationship(back_populates="book",sa_relationship_kwargs={'lazy':'raise', 'passive_deletes':True})
+    tags : List["Tag"] = Relationship(link_model=BookTag,back_populates="books", sa_relationship_kwargs={'lazy':'raise', 'passive_deletes':True})    
 
     
     # Method that gives a string representation of the book object in our db
@@ -74,6 +97,23 @@ class Book(SQLModel, table=True):
         return f"<Book {self.title}>"
     
 
+# Full-text search document over title, author and publisher, generated by Postgres.
+# It is added to the table after mapping so select(Book) never loads the tsvector;
+# queries reach it through Book.__table__.c.search_vector.
+Book.__table__.append_column(
+    Column(
+        "search_vector",
+        pg.TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(publisher, '')), 'C')",
+            persisted=True
+        )
+    )
+)
+Index("ix_books_search_vector", Book.__table__.c.search_vector, postgresql_using="gin")
+
     
 class Review(SQLModel, table=True):
     __tablename__ = "review"
@@ -87,10 +127,11 @@ class Review(SQLModel, table=True):
         ))
     rating: int = Field(lt=5)
     review_text: str
-    user_uid: Optional[uuid.UUID] = Field(default= None, foreign_key="users.uid")
-    book_uid: Optional[uuid.UUID] = Field(default= None, foreign_key="books.uid")
+    user_uid: Optional[uuid.UUID] = Field(default= None, foreign_key="users.uid", index=True)
+    book_uid: Optional[uuid.UUID] = Field(default= None, foreign_key="books.uid", index=True, ondelete="CASCADE")
+    version:int = Field(default=1, sa_column_kwargs={"server_default":"1"})
     created_at:datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
-    updated_at:datetime = Field(sa_column=Column(pg.TIMESTAMP,default=datetime.now))
+    updated_at:datetime = Field(sa_column=Column(pg.TIMESTAMP,default=datetime.now, onupdate=datetime.now))
     # Relationship with the user model
     user : Optional["User"] = Relationship(back_populates="reviews")
     # Relationship with the book model
@@ -110,10 +151,46 @@ class Tag(SQLModel,table=True):
             primary_key=True,
             default=uuid.uuid4
         ))
-    name: str = Field(sa_column=Column(pg.VARCHAR, nullable=False))
+    name: str = Field(sa_column=Column(pg.VARCHAR, nullable=False, unique=True, index=True))
+    version:int = Field(default=1, sa_column_kwargs={"server_default":"1"})
     created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
-    books : List["Book"] = Relationship(link_model=BookTag,back_populates="tags", sa_relationship_kwargs={'lazy':'selectin'})    
+    books : List["Book"] = Relationship(link_model=BookTag,back_populates="tags", sa_relationship_kwargs={'lazy':'raise', 'passive_deletes':True})    
     
     def __repr__(self):
         return f"<Tag {self.name}>"
     
+
+
+class OutboxEmail(SQLModel, table=True):
+    """An email written in the same transaction as the change it announces.
+    
+    Rows are handed to Celery once the transaction commits, and swept up again by a
+    periodic task if that hand-off was lost. sent_at stops later dispatches, but a worker lost
+    between sending and recording sent_at leaves the email to be sent again: delivery is at least
+    once, with a Message-ID derived from the uid so duplicates can be recognised.
+    """
+    __tablename__ = "email_outbox"
+    # Only unsent rows are ever scanned, oldest first
+    __table_args__ = (
+        Index("ix_email_outbox_pending_created_at", "created_at", postgresql_where=text("sent_at IS NULL")),
+    )
+    
+    # Generated in Python so the uid is known before the commit, for the dispatch after it
+    uid: uuid.UUID = Field(
+        default_factory=uuid.uuid4,
+        sa_column=Column(
+            pg.UUID,
+            nullable=False,
+            primary_key=True
+        ))
+    recipients: List[str] = Field(sa_column=Column(pg.ARRAY(pg.VARCHAR), nullable=False))
+    subject: str
+    body: str
+    attempts:int = Field(default=0, sa_column_kwargs={"server_default":"0"})
+    # Set while a worker is sending the email, so a second dispatch of the row is a no-op
+    claimed_until: Optional[datetime] = Field(default=None, sa_column=Column(pg.TIMESTAMP, nullable=True))
+    sent_at: Optional[datetime] = Field(default=None, sa_column=Column(pg.TIMESTAMP, nullable=True))
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    
+    def __repr__(self):
+        return f"<OutboxEmail {self.subject} to {self.recipients}>"
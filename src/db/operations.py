@@ -0,0 +1,69 @@
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select, update
+from sqlalchemy import or_
+from src.errors import PreconditionFailed
+from typing import Any, Dict, List, Optional, Tuple
+
+
+async def update_entity(session:AsyncSession, model, uid, values:Dict[str, Any], versions:Optional[List[int]] = None) -> Tuple[Any, Optional[dict]]:
+    """Apply a partial update to one row in a single UPDATE ... RETURNING, without committing.
+
+    Only the fields whose value actually differs are part of the write; the old row is read
+    and locked in the same statement, so callers get the previous values for their deltas.
+    A write bumps the row's version, and updated_at through its onupdate default.
+
+    Returns (entity, previous values) after a write, (entity, None) when the payload changed
+    nothing and (None, None) when the row does not exist. Raises PreconditionFailed when
+    versions is given and the row's current version is not one of them.
+    """
+    if values:
+        written = await write_changes(session, model, uid, values, versions)
+
+        if written is not None:
+            return written
+
+    # Nothing was written: tell a missing row, a stale version and a no-op payload apart
+    result = await session.exec(select(model).where(model.uid == uid).execution_options(populate_existing=True))
+    entity = result.first()
+
+    if entity is None:
+        return None, None
+
+    if versions is not None and entity.version not in versions:
+        raise PreconditionFailed()
+
+    return entity, None
+
+
+async def write_changes(session:AsyncSession, model, uid, values:Dict[str, Any], versions:Optional[List[int]]):
+    """UPDATE the row from a locked read of its old values, returning None when no row qualified."""
+    old = (
+        select(model.uid, model.version, *(getattr(model, key) for key in values))
+        .where(model.uid == uid)
+        .with_for_update()
+        .subquery("old")
+    )
+
+    statement = (
+        update(model)
+        .where(
+            model.uid == old.c.uid,
+            or_(*(getattr(model, key).is_distinct_from(value) for key, value in values.items()))
+        )
+        .values(**values, version=old.c.version + 1)
+        .returning(model, *(old.c[key] for key in values))
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+
+    if versions is not None:
+        statement = statement.where(old.c.version.in_(versions))
+
+    result = await session.exec(statement)
+    row = result.first()
+
+    if row is None:
+        return None
+
+    entity, *previous = row
+
+    return entity, dict(zip(values, previous))
@@ -0,0 +1,96 @@
+from fastapi import FastAPI
+from fastapi.requests import Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import Counter
+from src.config import Config
+from typing import Iterator, List, Tuple
+import logging
+import re
+import time
+
+# Runs of bound parameters, so an IN list of any length has one shape
+PARAMETERS = re.compile(r"\$\d+(::\w+)?(\s*,\s*\$\d+(::\w+)?)*")
+
+
+def statement_shape(statement:str) -> str:
+    return " ".join(PARAMETERS.sub("?", statement).split())
+
+
+class QueryStats:
+    """Statements sent to the database while it is the current one, and the time they took."""
+    
+    def __init__(self) -> None:
+        self.statements: List[str] = []
+        self.parameters: list = []
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+        
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+    
+    def record(self, statement:str, seconds:float, parameters=None) -> None:
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+        
+    def repeated(self, threshold:int) -> List[Tuple[str, int]]:
+        """Statement shapes run at least threshold times, the usual sign of an N+1 query."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+# Trackers can nest, e.g. a test's budget around a request the middleware also tracks
+current_query_stats: ContextVar[Tuple[QueryStats, ...]] = ContextVar("current_query_stats", default=())
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Record the statements run in this context, by any engine, until the block exits."""
+    stats = QueryStats()
+    token = current_query_stats.set(current_query_stats.get() + (stats,))
+    
+    try:
+        yield stats
+        
+    finally:
+        current_query_stats.reset(token)
+
+
+# Listening on the Engine class covers every engine, including the ones tests create
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    
+    for stats in current_query_stats.get():
+        stats.record(statement, elapsed, parameters)
+
+
+def register_query_tracking(app:FastAPI):
+    """
+    In development (DB_QUERY_HEADERS), report each request's statements in X-DB-Queries and
+    Server-Timing headers and warn about repeated statement shapes.
+    """
+    if not Config.DB_QUERY_HEADERS:
+        return
+    
+    @app.middleware('http')
+    async def query_tracking(request: Request, call_next):
+        with track_queries() as stats:
+            response = await call_next(request)
+            
+        response.headers["X-DB-Queries"] = str(stats.count)
+        response.headers.append("Server-Timing", f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries"')
+        
+        for shape, count in stats.repeated(Config.N_PLUS_ONE_THRESHOLD):
+            logging.warning("Possible N+1 in %s %s: %d x %s", request.method, request.url.path, count, shape)
+            
+        return response
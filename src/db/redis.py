@@ -1,20 +1,180 @@
 from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
 from src.config import Config
+from src.metrics import REDIS_COMMAND_LATENCY
+from typing import Dict, Iterable, Optional, Tuple
+import asyncio
+import logging
+import json
+import time
 
 
-JTI_EXPIRY = 3600
+# Sorted set of revoked jtis scored by their token's expiry, and the channel announcing new ones
+BLOCKLIST_KEY = "revoked_jtis"
+BLOCKLIST_CHANNEL = "revoked_jtis"
 
-token_blocklist = aioredis.from_url(Config.REDIS_URL)
+# Hash of user uid to token generation; tokens issued with an older generation are revoked
+TOKEN_GENERATIONS_KEY = "token_generations"
 
+# Seconds between sweeps of expired jtis out of the local blocklist
+BLOCKLIST_PRUNE_INTERVAL = 60
 
+class TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error:bool = True):
+        with REDIS_COMMAND_LATENCY.labels(command="PIPELINE").time():
+            return await super().execute(raise_on_error)
 
-async def add_jti_to_blocklist(jti:str) -> None:
-    await token_blocklist.set(name=jti,value="",ex=JTI_EXPIRY)
+
+class TimedRedis(aioredis.Redis):
+    """Redis client recording the latency of each command it sends."""
+    
+    async def execute_command(self, *args, **options):
+        with REDIS_COMMAND_LATENCY.labels(command=str(args[0]).upper()).time():
+            return await super().execute_command(*args, **options)
+        
+    def pipeline(self, transaction:bool = True, shard_hint=None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# Shared client for the token blocklist and the application caches
+redis_client = TimedRedis.from_url(Config.REDIS_URL, health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL)
+
+
+class RevokedTokens:
+    """This worker's copy of the blocklist, each jti kept until its token expires,
+    and of the users' token generations.
+    
+    It is only trusted while synced, that is seeded from Redis with a live subscription
+    to BLOCKLIST_CHANNEL; until then blocklist checks go to Redis.
+    """
+    
+    def __init__(self) -> None:
+        self.expiries: Dict[str, float] = {}
+        self.generations: Dict[str, int] = {}
+        self.synced = False
+        self.next_prune = 0.0
+        
+    def seed(self, entries:Iterable[Tuple[str, float]], generations:Optional[Dict] = None) -> None:
+        now = time.time()
+        
+        self.expiries = {self.decode(jti):expires_at for jti, expires_at in entries if expires_at > now}
+        self.generations = {self.decode(user_uid):int(generation) for user_uid, generation in (generations or {}).items()}
+        self.next_prune = now + BLOCKLIST_PRUNE_INTERVAL
+        self.synced = True
+        
+    def add(self, jti, expires_at:float) -> None:
+        self.expiries[self.decode(jti)] = expires_at
+        
+        now = time.time()
+        
+        # expired tokens fail signature checks anyway, so their jtis can go, in one sweep per interval
+        if now >= self.next_prune:
+            self.expiries = {key:value for key, value in self.expiries.items() if value > now}
+            self.next_prune = now + BLOCKLIST_PRUNE_INTERVAL
+        
+    def set_generation(self, user_uid:str, generation:int) -> None:
+        # generations only grow, so a late message never lowers one
+        self.generations[user_uid] = max(self.generations.get(user_uid, 0), generation)
+        
+    def __contains__(self, jti:str) -> bool:
+        return self.expiries.get(jti, 0) > time.time()
+    
+    @staticmethod
+    def decode(jti) -> str:
+        return jti.decode() if isinstance(jti, bytes) else jti
+
+
+revoked_tokens = RevokedTokens()
+
+
+async def add_jti_to_blocklist(jti:str, expires_at:float) -> None:
+    """Revoke a token until it expires and announce it to every worker."""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.zadd(BLOCKLIST_KEY, {jti:expires_at})
+        pipe.zremrangebyscore(BLOCKLIST_KEY, "-inf", time.time())
+        pipe.publish(BLOCKLIST_CHANNEL, json.dumps({"jti":jti, "exp":expires_at}))
+        await pipe.execute()
+    
+    revoked_tokens.add(jti, expires_at)
     
 async def token_in_blocklist(jti:str) -> bool:
-    jti = await token_blocklist.get(jti)
+    if revoked_tokens.synced:
+        return jti in revoked_tokens
+    
+    expires_at = await redis_client.zscore(BLOCKLIST_KEY, jti)
+    
+    return expires_at is not None and expires_at > time.time()
+
+
+async def revoke_user_tokens(user_uid:str) -> None:
+    """Revoke every access and refresh token of a user by moving to the next token generation."""
+    generation = await redis_client.hincrby(TOKEN_GENERATIONS_KEY, user_uid, 1)
+    
+    await redis_client.publish(BLOCKLIST_CHANNEL, json.dumps({"user_uid":user_uid, "gen":generation}))
+    
+    revoked_tokens.set_generation(user_uid, generation)
+    
+async def user_token_generation(user_uid:str) -> int:
+    """The generation new tokens of the user are issued with; tokens with a lower one are revoked."""
+    if revoked_tokens.synced:
+        return revoked_tokens.generations.get(user_uid, 0)
+    
+    generation = await redis_client.hget(TOKEN_GENERATIONS_KEY, user_uid)
+    
+    return int(generation) if generation is not None else 0
+
+
+async def sync_revoked_tokens() -> None:
+    """Keep revoked_tokens in step with Redis for the lifetime of the worker.
     
-    return jti is not None
+    The subscription starts before the seeding read, so no revocation falls between the two.
+    An idle subscription is pinged and must answer within one health check interval, so a
+    silently dropped connection is noticed; after any listener error the copy is distrusted
+    and rebuilt.
+    """
+    while True:
+        pubsub = redis_client.pubsub()
+        
+        try:
+            await pubsub.subscribe(BLOCKLIST_CHANNEL)
+            
+            revoked_tokens.seed(
+                await redis_client.zrangebyscore(BLOCKLIST_KEY, time.time(), "+inf", withscores=True),
+                await redis_client.hgetall(TOKEN_GENERATIONS_KEY)
+            )
+            
+            awaiting_pong = False
+            
+            while True:
+                message = await pubsub.get_message(timeout=Config.REDIS_HEALTH_CHECK_INTERVAL)
+                
+                if message is None:
+                    if awaiting_pong:
+                        raise TimeoutError("Redis did not answer the blocklist subscription's ping")
+                    
+                    await pubsub.ping()
+                    awaiting_pong = True
+                    continue
+                
+                awaiting_pong = False
+                
+                if message["type"] == "message":
+                    revocation = json.loads(message["data"])
+                    
+                    if "jti" in revocation:
+                        revoked_tokens.add(revocation["jti"], revocation["exp"])
+                    else:
+                        revoked_tokens.set_generation(revocation["user_uid"], revocation["gen"])
+                    
+        except Exception as e:
+            revoked_tokens.synced = False
+            logging.warning("Blocklist sync failed, checking Redis until it resumes: %s", e)
+            
+        finally:
+            revoked_tokens.synced = False
+            await pubsub.aclose()
+            
+        await asyncio.sleep(Config.BLOCKLIST_RESYNC_DELAY)
 
 
 # Admin
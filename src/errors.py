@@ -64,6 +64,20 @@ class ReviewNotFound(BooklyException):
     """Review not found in the database."""
     pass
 
+class InvalidCursor(BooklyException):
+    """User has provided a pagination cursor that cannot be decoded."""
+    pass
+
+class PreconditionFailed(BooklyException):
+    """User has sent an If-Match precondition that does not match the current version of the resource."""
+    pass
+
+class RateLimitExceeded(BooklyException):
+    """User has sent more requests than the rate limit of the route allows."""
+    def __init__(self, retry_after:int) -> None:
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
 def create_exception_handler(status_code:int, initial_detail:Any) -> Callable[[Request,Exception], JSONResponse]:
     
     async def exception_handler(request:Request, exc:BooklyException):
@@ -78,6 +92,18 @@ def create_exception_handler(status_code:int, initial_detail:Any) -> Callable[[R
 
 
 
+async def rate_limit_exceeded_handler(request:Request, exc:RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        content={
+            "message":"Too many requests",
+            "resolution":f"Retry after {exc.retry_after} seconds",
+            "error_code":"rate_limit_exceeded"
+        },
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After":str(exc.retry_after)}
+    )
+
+
 def register_all_errors(app:FastAPI):
     """Register all custom error handlers with the FastAPI app."""
     app.add_exception_handler(
@@ -255,6 +281,17 @@ def register_all_errors(app:FastAPI):
             }
         )
     )
+    app.add_exception_handler(
+        InvalidCursor,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message":"Invalid pagination cursor",
+                "resolution":"Use the next_cursor returned by the previous page",
+                "error_code":"invalid_cursor"
+            }
+        )
+    )
     
     
 
@@ -265,4 +302,17 @@ def register_all_errors(app:FastAPI):
             content={"messsgae":"Oops! Something went wrong","error_code":"internal_server_error"},
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-        
\ No newline at end of file
+    
+    app.add_exception_handler(
+        PreconditionFailed,
+        create_exception_handler(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            initial_detail={
+                "message":"The resource was modified since you read it",
+                "resolution":"Fetch the current version and retry the update",
+                "error_code":"precondition_failed"
+            }
+        )
+    )
+    
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
@@ -0,0 +1,83 @@
+from fastapi import status
+from fastapi.requests import Request
+from fastapi.responses import Response
+from typing import List, Optional
+import hashlib
+
+
+def content_digest(*parts) -> str:
+    digest = hashlib.sha256()
+
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\x1f")
+
+    return digest.hexdigest()[:32]
+
+
+def compute_etag(*parts) -> str:
+    """Build a strong ETag from the values that identify a representation.
+
+    Callers pass cheap fingerprints (uids with their updated_at watermarks, or an
+    already serialized body) so the ETag is known before the response is rendered.
+    """
+    return f'"{content_digest(*parts)}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header against an ETag (weak comparison, as RFC 9110 requires for it)."""
+    if_none_match = request.headers.get("if-none-match")
+
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def version_etag(version: int, *parts) -> str:
+    """Build the ETag of a versioned row, which is what If-Match checks.
+
+    A read that embeds more than the row (a book with its reviews and tags) passes the body as
+    parts: a digest of it follows the version, so If-None-Match still sees the embedded changes.
+    """
+    if not parts:
+        return f'"{version}"'
+
+    return f'"{version}.{content_digest(*parts)}"'
+
+
+def if_match_versions(request: Request) -> Optional[List[int]]:
+    """Read the versions an update is conditional on from the If-Match header.
+
+    Writes are guarded by the row version, the leading part of the ETag of reads and updates.
+    Returns None when the update is unconditional; a tag that is not a version can never match.
+    """
+    if_match = request.headers.get("if-match")
+
+    if not if_match or if_match.strip() == "*":
+        return None
+
+    versions = []
+
+    for tag in if_match.split(","):
+        tag = tag.strip()
+
+        # If-Match uses strong comparison, so weak tags never match
+        if not (tag.startswith('"') and tag.endswith('"')):
+            continue
+
+        version = tag[1:-1].split(".", 1)[0]
+
+        if version.isdigit():
+            versions.append(int(version))
+
+    return versions
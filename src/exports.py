@@ -0,0 +1,59 @@
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import AsyncIterator
+from datetime import datetime
+from src.db.db import Session
+import csv
+import io
+import json
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson":"application/x-ndjson",
+    "csv":"text/csv",
+}
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return str(value)
+
+
+async def stream_rows(session:AsyncSession, statement, format:str) -> AsyncIterator[bytes]:
+    """Stream the rows of a statement as NDJSON or CSV, one chunk per cursor batch.
+
+    Rows come from a server-side cursor, so memory use does not depend on table size.
+    """
+    result = await session.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+    if format == "csv":
+        yield encode_csv([list(result.keys())])
+
+    async for rows in result.partitions():
+        if format == "csv":
+            yield encode_csv(rows)
+        else:
+            yield "".join(json.dumps(dict(row._mapping), default=json_default) + "\n" for row in rows).encode()
+
+
+def encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for row in rows:
+        writer.writerow(json_default(value) if value is not None else "" for value in row)
+
+    return buffer.getvalue().encode()
+
+
+async def stream_export(export) -> AsyncIterator[bytes]:
+    """Run an export generator on its own session.
+
+    The request session is closed before a streamed body is sent, so exports cannot use it.
+    """
+    async with Session() as session:
+        async for chunk in export(session):
+            yield chunk
@@ -1,6 +1,14 @@
 from fastapi_mail import FastMail,ConnectionConfig, MessageSchema,MessageType
 from src.config import Config
 from pathlib import Path
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import AsyncIterator, Optional, Tuple
+import aiosmtplib
+import asyncio
+import logging
+import time
 
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -12,10 +20,10 @@ mail_config =  ConnectionConfig(
     MAIL_PORT=Config.MAIL_PORT ,
     MAIL_SERVER=Config.MAIL_SERVER,
     MAIL_FROM_NAME=Config.MAIL_FROM_NAME,
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
+    MAIL_STARTTLS=Config.MAIL_STARTTLS,
+    MAIL_SSL_TLS=Config.MAIL_SSL_TLS,
+    USE_CREDENTIALS=Config.USE_CREDENTIALS,
+    VALIDATE_CERTS=Config.VALIDATE_CERTS,
     # TEMPLATE_FOLDER= Path(BASE_DIR,'templates'),
 )
 
@@ -31,4 +39,121 @@ def create_message(recipients:list[str],subject:str,body:str):
         subtype=MessageType.html,
     )
     
-    return message
\ No newline at end of file
+    return message
+
+def build_message(recipients:list[str], subject:str, body:str, message_id:Optional[str] = None) -> EmailMessage:
+    """HTML message for the pooled SMTP sender, matching what create_message renders."""
+    message = EmailMessage()
+    message["From"] = formataddr((Config.MAIL_FROM_NAME, Config.MAIL_FROM))
+    message["To"] = ", ".join(recipients)
+    message["Subject"] = subject
+    
+    if message_id is not None:
+        message["Message-ID"] = message_id
+        
+    message.set_content(body, subtype="html")
+    
+    return message
+
+
+def is_transient(error:Exception) -> bool:
+    """Whether retrying later may succeed: 4xx replies, dropped connections and timeouts."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return any(is_transient(refused) for refused in error.recipients)
+    
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    
+    return isinstance(error, (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError))
+
+
+class SMTPPool:
+    """Authenticated SMTP connections kept open between sends.
+    
+    It must be used from a single long-lived event loop, like the Celery worker loop.
+    Connections idle for longer than SMTP_IDLE_TIMEOUT are replaced, since servers drop them.
+    """
+    
+    def __init__(self, size:int) -> None:
+        self.size = size
+        self.idle: list = []
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.connections_opened = 0
+        
+    async def connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=Config.MAIL_SERVER,
+            port=Config.MAIL_PORT,
+            username=Config.MAIL_USERNAME if Config.USE_CREDENTIALS else None,
+            password=Config.MAIL_PASSWORD if Config.USE_CREDENTIALS else None,
+            use_tls=Config.MAIL_SSL_TLS,
+            start_tls=Config.MAIL_STARTTLS,
+            validate_certs=Config.VALIDATE_CERTS,
+        )
+        # connecting also runs STARTTLS and the login
+        await smtp.connect()
+        self.connections_opened += 1
+        
+        return smtp
+    
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosmtplib.SMTP]:
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.size)
+            
+        async with self.slots:
+            smtp = None
+            
+            while self.idle and smtp is None:
+                candidate, idle_since = self.idle.pop()
+                
+                if candidate.is_connected and time.monotonic() - idle_since < Config.SMTP_IDLE_TIMEOUT:
+                    smtp = candidate
+                else:
+                    candidate.close()
+                    
+            if smtp is None:
+                smtp = await self.connect()
+                
+            try:
+                yield smtp
+                
+            except BaseException:
+                # the session state is unknown after a failure
+                smtp.close()
+                raise
+            
+            self.idle.append((smtp, time.monotonic()))
+            
+    async def send(self, messages:list[EmailMessage]) -> Tuple[list[EmailMessage], Optional[Exception]]:
+        """Send messages over one connection, in order.
+        
+        Permanently refused messages are logged and dropped. A transient failure stops the
+        batch; the unsent messages are returned with the error so the caller can retry them.
+        """
+        sent = 0
+        
+        try:
+            async with self.connection() as smtp:
+                for message in messages:
+                    try:
+                        await smtp.send_message(message)
+                        
+                    except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPResponseException) as e:
+                        if is_transient(e):
+                            raise
+                        
+                        logging.error("Dropping undeliverable email to %s: %s", message["To"], e)
+                        
+                    sent += 1
+                    
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            
+            return messages[sent:], e
+        
+        return [], None
+
+
+smtp_pool = SMTPPool(Config.SMTP_POOL_SIZE)
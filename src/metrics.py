@@ -0,0 +1,120 @@
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, status
+from fastapi.requests import Request
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from celery.signals import before_task_publish
+from src.db.db import engine
+from src.config import Config
+import hmac
+import time
+
+# Requests are labelled with their route template, e.g. /api/v1/books/{book_uid},
+# so the number of series stays bounded by the number of routes
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "bookly_http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["method", "route", "status"],
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "bookly_http_requests_in_flight",
+    "HTTP requests being handled",
+    ["method"],
+)
+
+REDIS_COMMAND_LATENCY = Histogram(
+    "bookly_redis_command_duration_seconds",
+    "Round trip time of Redis commands, with pipelines as a single PIPELINE command",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+CELERY_TASKS_PUBLISHED = Counter(
+    "bookly_celery_tasks_published_total",
+    "Celery tasks sent to the broker",
+    ["task"],
+)
+
+
+def route_template(request:Request) -> str:
+    """The path template of the route that handled the request, read once routing is done.
+    
+    FastAPI's routes record themselves in the scope when they match; other routes (the docs)
+    and unknown paths are unmatched.
+    """
+    route = request.scope.get("route")
+    
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+def metrics_access(request:Request) -> None:
+    """Let /metrics through for METRICS_ALLOW_IPS and for callers sending "Bearer <METRICS_TOKEN>"."""
+    allowed_ips = [ip.strip() for ip in Config.METRICS_ALLOW_IPS.split(",") if ip.strip()]
+    
+    if request.client is not None and ("*" in allowed_ips or request.client.host in allowed_ips):
+        return
+    
+    if Config.METRICS_TOKEN and hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {Config.METRICS_TOKEN}"):
+        return
+    
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Metrics are not exposed to this client")
+
+
+class PoolCollector:
+    """Reads the database connection pool at scrape time."""
+    
+    def collect(self):
+        pool = engine.sync_engine.pool
+        
+        for name, documentation, value in (
+            ("bookly_db_pool_size", "Connections the pool keeps open", pool.size()),
+            ("bookly_db_pool_checked_out", "Connections in use by sessions", pool.checkedout()),
+            ("bookly_db_pool_checked_in", "Idle connections in the pool", pool.checkedin()),
+            ("bookly_db_pool_overflow", "Connections opened beyond the pool size; negative while the pool is not full", pool.overflow()),
+        ):
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+REGISTRY.register(PoolCollector())
+
+
+@before_task_publish.connect
+def count_published_task(sender=None, **kwargs):
+    CELERY_TASKS_PUBLISHED.labels(task=sender).inc()
+
+
+def register_metrics(app:FastAPI):
+    """
+    Time every request by method, route template and status.
+    """
+    @app.middleware('http')
+    async def request_metrics(request: Request, call_next):
+        method = request.method
+        status_code = 500
+        
+        # the route is only known once the router has run, so requests in flight are counted per method
+        in_flight = REQUESTS_IN_FLIGHT.labels(method=method)
+        in_flight.inc()
+        start_time = time.perf_counter()
+        
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method=method, route=route_template(request), status=status_code).observe(time.perf_counter() - start_time)
+            
+        return response
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False, dependencies=[Depends(metrics_access)])
+async def get_metrics():
+    """ Prometheus metrics of this worker"""
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -3,29 +3,103 @@ from fastapi.requests import Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from logging.handlers import QueueHandler, QueueListener
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+from src.config import Config
+from datetime import datetime, timezone
+import json
+import queue
+import random
+import sys
 import time 
 import logging
+import uuid
 
 # Disable the default Uvicorn access log 
 logger = logging.getLogger('uvicorn.access')
 logger.disabled = True
 
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as one JSON object, merging in the fields passed as extra={"fields":...}."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time":datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level":record.levelname,
+            "logger":record.name,
+            "message":record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        
+        return json.dumps(entry, default=str)
+
+
+# Requests only put records on the queue; the listener thread formats and writes them,
+# so a slow or contended stdout never blocks the event loop
+access_log_queue = queue.SimpleQueue()
+
+access_log_handler = logging.StreamHandler(sys.stdout)
+access_log_handler.setFormatter(JSONFormatter())
+
+access_log_listener = QueueListener(access_log_queue, access_log_handler)
+
+access_logger = logging.getLogger("bookly.access")
+access_logger.setLevel(logging.INFO)
+access_logger.addHandler(QueueHandler(access_log_queue))
+access_logger.propagate = False
+
+
+def should_log(status_code: int, duration_ms: float) -> bool:
+    """Errors and slow requests are always logged, other requests at ACCESS_LOG_SAMPLE_RATE."""
+    if status_code >= 400 or duration_ms >= Config.ACCESS_LOG_SLOW_MS:
+        return True
+    
+    return random.random() < Config.ACCESS_LOG_SAMPLE_RATE
+
+
+def request_id_of(request: Request) -> str:
+    """The caller's request ID when it sent a sane one, otherwise a new one."""
+    request_id = request.headers.get(REQUEST_ID_HEADER, "")
+    
+    if 0 < len(request_id) <= 128 and request_id.isprintable():
+        return request_id
+    
+    return uuid.uuid4().hex
+
 def register_middleware(app: FastAPI):
     """
     Register middleware for the FastAPI application.
     """
     @app.middleware('http')
     async def custom_logging(request: Request, call_next):
-        start_time = time.time()
+        start_time = time.perf_counter()
         
-        # Log the request details           
-        response = await call_next(request)
+        request.state.request_id = request_id_of(request)
+        status_code = 500
         
-        processing_time = time.time() - start_time
-        
-        message = f"{request.client.host}:{request.client.port} - {request.method} - {request.url.path} - {response.status_code} completed after {processing_time:.2f} seconds"
-
-        print(message)
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            response.headers[REQUEST_ID_HEADER] = request.state.request_id
+            
+        finally:
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            
+            if should_log(status_code, duration_ms):
+                access_logger.info(
+                    "%s %s %s", request.method, request.url.path, status_code,
+                    extra={"fields":{
+                        "request_id":request.state.request_id,
+                        "client":f"{request.client.host}:{request.client.port}" if request.client else None,
+                        "method":request.method,
+                        "path":request.url.path,
+                        "status":status_code,
+                        "duration_ms":round(duration_ms, 2),
+                    }}
+                )
                 
         return response
     
@@ -43,19 +117,13 @@ def register_middleware(app: FastAPI):
         allowed_hosts=["localhost","127.0.0.1","0.0.0.0","bookly-api-j8hb.onrender.com"]
     )
     
+    # Without this every client behind the proxy shares its address, and its rate limit buckets
+    app.add_middleware(
+        ProxyHeadersMiddleware,
+        trusted_hosts=Config.FORWARDED_ALLOW_IPS
+    )
     
     
-    @app.middleware('http')
-    async def debug_host(request: Request, call_next):
-        """
-        Middleware to log the host of the request.
-        """
-        print(f"Request host: {request.client.host}")
-        
-        response = await call_next(request)
-        
-        return response
-    
     
     
     
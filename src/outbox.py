@@ -0,0 +1,77 @@
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select, update
+from sqlalchemy import or_
+from src.db.models import OutboxEmail
+from src.config import Config
+from datetime import datetime, timedelta
+from typing import List, Optional
+import uuid
+
+
+def queue_email(session:AsyncSession, recipients:list[str], subject:str, body:str) -> OutboxEmail:
+    """Add an email to the outbox; it is only written, and later sent, if the session commits."""
+    email = OutboxEmail(recipients=recipients, subject=subject, body=body)
+    
+    session.add(email)
+    
+    return email
+
+
+def outbox_message_id(uid:uuid.UUID) -> str:
+    """Message-ID of an outbox email, the same on every attempt so a resend can be told apart as a duplicate."""
+    return f"<outbox.{uid}@{Config.MAIL_FROM.rpartition('@')[2]}>"
+
+
+async def claim_email(session:AsyncSession, uid:uuid.UUID) -> Optional[OutboxEmail]:
+    """Lease an unsent email for one send attempt, returning None when it was sent or is being sent."""
+    now = datetime.now()
+    
+    statement = (
+        update(OutboxEmail)
+        .where(
+            OutboxEmail.uid == uid,
+            OutboxEmail.sent_at.is_(None),
+            or_(OutboxEmail.claimed_until.is_(None), OutboxEmail.claimed_until < now)
+        )
+        .values(claimed_until=now + timedelta(seconds=Config.OUTBOX_CLAIM_TIMEOUT), attempts=OutboxEmail.attempts + 1)
+        .returning(OutboxEmail)
+    )
+    
+    result = await session.exec(statement)
+    email = result.scalars().first()
+    
+    await session.commit()
+    
+    return email
+
+
+async def mark_sent(session:AsyncSession, uid:uuid.UUID) -> None:
+    await session.exec(update(OutboxEmail).where(OutboxEmail.uid == uid).values(sent_at=datetime.now(), claimed_until=None))
+    await session.commit()
+
+
+async def release_email(session:AsyncSession, uid:uuid.UUID) -> None:
+    """Give up the lease after a failed attempt, so a retry can claim the email straight away."""
+    await session.exec(update(OutboxEmail).where(OutboxEmail.uid == uid).values(claimed_until=None))
+    await session.commit()
+
+
+async def pending_emails(session:AsyncSession) -> List[uuid.UUID]:
+    """Unsent, unclaimed emails old enough that their dispatch after commit has been lost."""
+    now = datetime.now()
+    
+    statement = (
+        select(OutboxEmail.uid)
+        .where(
+            OutboxEmail.sent_at.is_(None),
+            OutboxEmail.created_at < now - timedelta(seconds=Config.OUTBOX_SWEEP_DELAY),
+            OutboxEmail.attempts < Config.OUTBOX_MAX_ATTEMPTS,
+            or_(OutboxEmail.claimed_until.is_(None), OutboxEmail.claimed_until < now)
+        )
+        .order_by(OutboxEmail.created_at)
+        .limit(Config.OUTBOX_SWEEP_BATCH)
+    )
+    
+    result = await session.exec(statement)
+    
+    return result.all()
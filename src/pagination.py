@@ -0,0 +1,25 @@
+import base64
+import json
+from src.errors import InvalidCursor
+
+
+def encode_cursor(data: dict) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor."""
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by `encode_cursor`, raising InvalidCursor if it was tampered with."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor() from e
+
+    if not isinstance(data, dict):
+        raise InvalidCursor()
+
+    return data
@@ -0,0 +1,115 @@
+from fastapi import FastAPI, Depends
+from fastapi.exceptions import HTTPException
+from fastapi.requests import Request
+from fastapi.responses import HTMLResponse, Response
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.ratelimit import local_windows, parse_rate
+from src.auth.dependencies import AccessTokenBearer, RoleChecker, get_current_user
+from src.db.db import get_session
+from src.errors import BooklyException
+from src.config import Config
+import logging
+import time
+
+PROFILE_HEADER = "X-Profile"
+
+profile_rate = parse_rate(Config.PROFILE_RATE_LIMIT)
+
+
+class ProfileSlot:
+    """Admits one profiled request at a time on this worker, at most PROFILE_RATE_LIMIT of them."""
+    
+    def __init__(self) -> None:
+        self.busy = False
+        
+    def acquire(self) -> bool:
+        if self.busy or local_windows.acquire("profile", profile_rate, int(time.time() * 1000)):
+            return False
+        
+        self.busy = True
+        
+        return True
+    
+    def release(self) -> None:
+        self.busy = False
+
+
+profile_slot = ProfileSlot()
+
+access_token_bearer = AccessTokenBearer()
+admin_role_checker = RoleChecker(['admin'])
+
+
+async def profile_request(request: Request, session: AsyncSession = Depends(get_session)):
+    """Profile the endpoint when a verified admin sends X-Profile, leaving the profiler on request.state.
+    
+    The caller goes through get_current_user and RoleChecker with the request's own session
+    before a profiling slot is taken, so nobody else can use up the cap. Requests without
+    the header skip all of it.
+    """
+    output = request.headers.get(PROFILE_HEADER)
+    
+    if not output:
+        yield
+        return
+    
+    try:
+        admin_role_checker(await get_current_user(await access_token_bearer(request), session))
+        
+    except (BooklyException, HTTPException):
+        yield
+        return
+    
+    if not profile_slot.acquire():
+        yield
+        return
+    
+    profiler = Profiler(interval=Config.PROFILE_INTERVAL, async_mode="enabled")
+    
+    try:
+        profiler.start()
+        
+        try:
+            yield
+            
+        finally:
+            profiler.stop()
+            
+    finally:
+        profile_slot.release()
+        
+    request.state.profile = (output, profiler)
+
+
+def register_profiling(app:FastAPI):
+    """
+    Return a sampling profile of the request instead of its response when an admin sends X-Profile.
+    
+    "X-Profile: speedscope" returns speedscope JSON, any other value pyinstrument's HTML.
+    profile_request is added to the app's dependencies, so it covers the routes included
+    after this call.
+    """
+    if profile_rate is None:
+        return
+    
+    app.router.dependencies.append(Depends(profile_request))
+    
+    @app.middleware('http')
+    async def send_profile(request: Request, call_next):
+        response = await call_next(request)
+        
+        profile = getattr(request.state, "profile", None)
+        
+        if profile is None:
+            return response
+        
+        output, profiler = profile
+        
+        logging.info("Profiled %s %s for an admin", request.method, request.url.path)
+        
+        if output == "speedscope":
+            return Response(content=profiler.output(renderer=SpeedscopeRenderer()), media_type="application/json")
+        
+        return HTMLResponse(profiler.output_html())
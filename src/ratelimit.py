@@ -0,0 +1,179 @@
+from fastapi.requests import Request
+from pyrate_limiter import Duration, InMemoryBucket, Rate, RateItem
+from redis.exceptions import RedisError
+from src.db.redis import TimedRedis
+from src.errors import RateLimitExceeded
+from src.cache import LRUCache
+from src.config import Config
+from typing import Optional, Sequence
+import logging
+import math
+import time
+import uuid
+
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+PERIODS = {
+    "second":Duration.SECOND,
+    "minute":Duration.MINUTE,
+    "hour":Duration.HOUR,
+    "day":Duration.DAY,
+}
+
+# Sliding-window log: one sorted set member per request, scored by its time in ms.
+# Returns 0 when the request is admitted, else the ms until the oldest request leaves the window.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return 0
+end
+
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return math.max(tonumber(oldest[2]) + window - now, 1)
+"""
+
+# Own pool whose socket timeout bounds each call: a timed out connection is dropped by the
+# client rather than cancelled mid-reply and handed back to the pool
+rate_limit_redis = TimedRedis.from_url(
+    Config.REDIS_URL,
+    socket_timeout=Config.RATE_LIMIT_REDIS_TIMEOUT,
+    socket_connect_timeout=Config.RATE_LIMIT_REDIS_TIMEOUT
+)
+
+sliding_window = rate_limit_redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+# Seconds between repeats of the warning that limits are on local windows
+FALLBACK_WARNING_INTERVAL = 60
+
+
+def parse_rate(rate:str) -> Optional[Rate]:
+    """Parse a limit such as "5/minute"; an empty string disables the limit."""
+    if not rate:
+        return None
+
+    limit, period = rate.split("/")
+
+    return Rate(int(limit), PERIODS[period.strip()])
+
+
+class LocalWindows:
+    """Per-worker windows used while Redis is slow or down, so limits still apply, per worker."""
+
+    def __init__(self) -> None:
+        self.buckets = LRUCache(Config.TOKEN_CACHE_SIZE)
+
+    def acquire(self, key:str, rate:Rate, now:int) -> int:
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            bucket = InMemoryBucket([rate])
+
+        bucket.leak(now)
+        self.buckets.set(key, bucket, expires_at=now / 1000 + rate.interval / 1000)
+
+        item = RateItem(key, now)
+
+        if bucket.put(item):
+            return 0
+
+        return max(bucket.waiting(item), 1)
+
+
+local_windows = LocalWindows()
+
+
+class FallbackLog:
+    """Warns when rate limiting falls back to local windows, at most once per interval
+    while Redis stays unavailable, and notes when it is back."""
+
+    def __init__(self) -> None:
+        self.next_warning = 0.0
+        self.degraded = False
+
+    def failed(self, error:Exception) -> None:
+        now = time.monotonic()
+
+        if now >= self.next_warning:
+            logging.warning("Rate limiting on local windows, Redis unavailable: %r", error)
+            self.next_warning = now + FALLBACK_WARNING_INTERVAL
+
+        self.degraded = True
+
+    def recovered(self) -> None:
+        if self.degraded:
+            logging.info("Rate limiting back on Redis")
+            self.degraded = False
+            self.next_warning = 0.0
+
+
+fallback_log = FallbackLog()
+
+
+class RateLimiter:
+    """Dependency admitting at most rate requests per window for each client IP and,
+    with "email" in keys, for each account named in the JSON body.
+
+    Counters live in Redis so every worker shares them; when Redis fails or does not answer
+    within the client's RATE_LIMIT_REDIS_TIMEOUT socket timeout, this worker's local windows
+    are used instead. The client IP is
+    the one forwarded by the proxies trusted in FORWARDED_ALLOW_IPS.
+    """
+
+    def __init__(self, scope:str, rate:str, keys:Sequence[str] = ("ip",)) -> None:
+        self.scope = scope
+        self.rate = parse_rate(rate)
+        self.keys = keys
+
+    async def __call__(self, request:Request) -> None:
+        if self.rate is None:
+            return
+
+        for key in await self.request_keys(request):
+            wait_ms = await self.acquire(f"{RATE_LIMIT_PREFIX}{self.scope}:{key}")
+
+            if wait_ms:
+                raise RateLimitExceeded(retry_after=math.ceil(wait_ms / 1000))
+
+    async def request_keys(self, request:Request) -> list:
+        keys = []
+
+        if "ip" in self.keys:
+            keys.append(f"ip:{request.client.host if request.client else 'unknown'}")
+
+        if "email" in self.keys:
+            try:
+                body = await request.json()
+
+            except ValueError:
+                body = None
+
+            # a body that is not a JSON object is left for the route's validation to reject
+            email = body.get("email") if isinstance(body, dict) else None
+
+            if isinstance(email, str):
+                keys.append(f"email:{email.strip().lower()}")
+
+        return keys
+
+    async def acquire(self, key:str) -> int:
+        now = int(time.time() * 1000)
+
+        try:
+            wait_ms = await sliding_window(keys=[key], args=[now, self.rate.interval, self.rate.limit, f"{now}:{uuid.uuid4().hex}"])
+
+        except RedisError as e:
+            # socket timeouts surface as redis.exceptions.TimeoutError, a RedisError
+            fallback_log.failed(e)
+
+            return local_windows.acquire(key, self.rate, now)
+
+        fallback_log.recovered()
+
+        return wait_ms
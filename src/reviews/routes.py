@@ -1,36 +1,58 @@
-from fastapi import APIRouter, Depends,status
-from src.db.models import User
+from fastapi import APIRouter, Depends,status, Request, Response, Query
+from fastapi.responses import StreamingResponse
+from src.auth.schemas import Principal
 from src.reviews.schemas import ReviewCreateModel,ReviewModel
 from src.db.db import get_session
 from sqlmodel.ext.asyncio.session import AsyncSession
 from .service import ReviewService
-from src.auth.dependencies import get_current_user
-from typing import List
-
-review_router = APIRouter()
+from src.auth.dependencies import get_current_user, RoleChecker
+from src.exports import EXPORT_MEDIA_TYPES, stream_export
+from src.config import Config
+from src.ratelimit import RateLimiter
+from src.timing import TimedRoute
+from src.etags import compute_etag, etag_matches, not_modified, if_match_versions, version_etag
+from typing import List, Optional
+
+review_router = APIRouter(route_class=TimedRoute, dependencies=[Depends(RateLimiter("reviews", Config.REVIEWS_RATE_LIMIT))])
 review_service = ReviewService()
 
 
 @review_router.post("/book/{book_uid}", status_code=status.HTTP_201_CREATED, response_model=ReviewModel)
-async def add_review_to_book(book_uid:str,review_data: ReviewCreateModel,current_user:User = Depends(get_current_user), session:AsyncSession = Depends(get_session)):
+async def add_review_to_book(book_uid:str,review_data: ReviewCreateModel,current_user:Principal = Depends(get_current_user), session:AsyncSession = Depends(get_session)):
     new_review = await review_service.add_review_to_book(user_email=current_user.email, review_data=review_data, book_uid=book_uid, session=session)
     
     return new_review
 
 @review_router.get("/",status_code=status.HTTP_200_OK, response_model=List[ReviewModel])
-async def get_all_reviews(session: AsyncSession= Depends(get_session)):
+async def get_all_reviews(request:Request, response:Response, session: AsyncSession= Depends(get_session)):
     reviews = await review_service.get_all_reviews(session=session)
+    
+    etag = compute_etag(*((review.uid, review.updated_at) for review in reviews))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    response.headers["ETag"] = etag
     return reviews
 
 
+@review_router.get("/export", dependencies=[Depends(RoleChecker(['admin']))])
+async def export_reviews(format:str = Query(default="ndjson", pattern="^(ndjson|csv)$")):
+    """ Stream every review as NDJSON or CSV"""
+    return StreamingResponse(
+        stream_export(lambda session: review_service.export_reviews(session, format)),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition":f'attachment; filename="reviews.{format}"'}
+    )
+
 @review_router.get("/{review_uid}", status_code=status.HTTP_200_OK, response_model=ReviewModel)
 async def get_review_by_id(review_uid:str, session:AsyncSession = Depends(get_session)):
     review = await review_service.get_review_by_id(review_uid=review_uid, session=session)
     return review
 
 @review_router.patch("/{review_uid}", response_model=ReviewModel, status_code=status.HTTP_200_OK)
-async def update_review(review_uid:str, review_data:ReviewCreateModel, session:AsyncSession = Depends(get_session)):
-    updated_review = await review_service.update_review(review_uid=review_uid, review_data=review_data, session=session)
+async def update_review(review_uid:str, review_data:ReviewCreateModel, response:Response, versions:Optional[List[int]] = Depends(if_match_versions), session:AsyncSession = Depends(get_session)):
+    updated_review = await review_service.update_review(review_uid=review_uid, review_data=review_data, session=session, versions=versions)
+    response.headers["ETag"] = version_etag(updated_review.version)
     return updated_review
 
 @review_router.delete("/{review_uid}", status_code=status.HTTP_204_NO_CONTENT)
@@ -9,6 +9,7 @@ class ReviewModel(BaseModel):
     review_text: str
     user_uid: Optional[uuid.UUID]
     book_uid: Optional[uuid.UUID]
+    version: int
     created_at:datetime 
     updated_at:datetime
 
@@ -1,12 +1,16 @@
 from src.db.models import Review
 from src.auth.service import UserService
 from src.books.service import BookService
+from src.books.cache import invalidate_book
+from src.exports import stream_rows
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.reviews.schemas import ReviewCreateModel
 from fastapi import HTTPException, status
 import logging
-from src.errors import ReviewNotFound, UserNotFound, BookNotFound
-from sqlmodel import select,desc
+from src.errors import BooklyException, ReviewNotFound, UserNotFound, BookNotFound
+from src.db.operations import update_entity
+from typing import List, Optional
+from sqlmodel import select,desc,delete
 
 book_service = BookService()
 user_service = UserService()
@@ -31,8 +35,12 @@ class ReviewService():
             
             session.add(new_review)
             
+            await book_service.update_rating_aggregates(book.uid, 1, new_review.rating, session)
+            
             await session.commit()
             
+            await invalidate_book(book_uid)
+            
             return new_review
         
         except Exception as e:
@@ -46,6 +54,12 @@ class ReviewService():
         
         return result.all()
     
+    def export_reviews(self, session:AsyncSession, format:str):
+        """Stream every review as NDJSON or CSV."""
+        statement = select(*Review.__mapper__.columns)
+        
+        return stream_rows(session, statement, format)
+    
     async def get_review_by_id(self, review_uid:str, session:AsyncSession):
         try:
             review = await session.get(Review, review_uid)
@@ -61,39 +75,54 @@ class ReviewService():
     
     async def delete_review(self, review_uid:str, session:AsyncSession):
         try:
-            review = await session.get(Review, review_uid)
+            result = await session.exec(delete(Review).where(Review.uid == review_uid).returning(Review.book_uid, Review.rating))
             
-            if not review:
+            deleted = result.first()
+            
+            if not deleted:
                 raise ReviewNotFound()
             
-            await session.delete(review)
+            book_uid, rating = deleted
+            
+            if book_uid is not None:
+                await book_service.update_rating_aggregates(book_uid, -1, -rating, session)
+            
             await session.commit()
             
+            await invalidate_book(book_uid)
+            
             return {"message":"Review deleted successfully"}
         
+        except BooklyException:
+            raise
+        
         except Exception as e:
             logging.exception("Error deleting review: %s", e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Oops something went wrong")
         
-    async def update_review(self, review_uid:str, review_data:ReviewCreateModel, session:AsyncSession):
+    async def update_review(self, review_uid:str, review_data:ReviewCreateModel, session:AsyncSession, versions:Optional[List[int]] = None):
         try:
-            review = await session.get(Review, review_uid)
+            review, previous = await update_entity(session, Review, review_uid, review_data.model_dump(), versions)
             
             if not review:
                 raise ReviewNotFound()
             
-            update_review_dict = review_data.model_dump()
+            if previous is None:
+                return review
             
-            for k, v in update_review_dict.items():
-                setattr(review, k, v)
+            if review.book_uid is not None and review.rating != previous["rating"]:
+                await book_service.update_rating_aggregates(review.book_uid, 0, review.rating - previous["rating"], session)
                 
-                await session.commit()
-                await session.refresh(review)
+            await session.commit()
+            
+            await invalidate_book(review.book_uid)
             
             return review
         
+        except BooklyException:
+            raise
+        
         except Exception as e:
             logging.exception("Error updating review: %s", e)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Oops something went wrong")
         
-        
\ No newline at end of file
@@ -1,19 +1,30 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.db.db import get_session
 from src.tags.schemas import TagModel, TagAddModel,TagCreateModel
 from src.tags.service import TagService
 from src.auth.dependencies import RoleChecker
 from src.books.schemas import Book
+from src.config import Config
+from src.ratelimit import RateLimiter
+from src.timing import TimedRoute
+from src.etags import compute_etag, etag_matches, not_modified, if_match_versions, version_etag
 
-tags_router = APIRouter()
+tags_router = APIRouter(route_class=TimedRoute, dependencies=[Depends(RateLimiter("tags", Config.TAGS_RATE_LIMIT))])
 tag_service = TagService()
 role_checker = Depends(RoleChecker(['user','admin']))  
 
 @tags_router.get("/", response_model=List[TagModel])
-async def get_all_tags(session: AsyncSession = Depends(get_session)):
+async def get_all_tags(request: Request, response: Response, session: AsyncSession = Depends(get_session)):
     tags = await tag_service.get_tags(session=session)
+    
+    # tags have no updated_at, but every update bumps their version
+    etag = compute_etag(*((tag.uid, tag.version) for tag in tags))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    response.headers["ETag"] = etag
     return tags
 
 @tags_router.post("/", status_code=status.HTTP_201_CREATED, response_model=TagModel)
@@ -27,8 +38,9 @@ async def add_tags_to_book(book_uid: str, tag_data: TagAddModel, session: AsyncS
     return book_with_tag
 
 @tags_router.put("/{tag_uid}", response_model=TagModel,dependencies=[role_checker])
-async def update_tag(tag_uid: str, tag_update_data: TagCreateModel, session: AsyncSession = Depends(get_session)):
-    updated_tag = await tag_service.update_tag(tag_uid=tag_uid, tag_update_data=tag_update_data, session=session)
+async def update_tag(tag_uid: str, tag_update_data: TagCreateModel, response: Response, versions: Optional[List[int]] = Depends(if_match_versions), session: AsyncSession = Depends(get_session)):
+    updated_tag = await tag_service.update_tag(tag_uid=tag_uid, tag_update_data=tag_update_data, session=session, versions=versions)
+    response.headers["ETag"] = version_etag(updated_tag.version)
     return updated_tag
 
 @tags_router.delete("/{tag_uid}", status_code=status.HTTP_204_NO_CONTENT,dependencies=[role_checker])
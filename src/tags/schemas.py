@@ -7,6 +7,7 @@ from pydantic import BaseModel, Field
 class TagModel(BaseModel):
     uid: uuid.UUID
     name: str
+    version: int
     created_at: datetime
     
 class TagCreateModel(BaseModel):
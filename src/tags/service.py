@@ -1,10 +1,16 @@
 from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import HTTPException, status
-from sqlmodel import select,desc
-from src.db.models import Tag
+from sqlmodel import select,desc,delete
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import IntegrityError
+from src.db.models import Tag, Book, BookTag
 from src.tags.schemas import TagModel, TagCreateModel, TagAddModel
+from src.db.operations import update_entity
+from typing import List, Optional
 import logging
 from src.books.service import BookService
+from src.books.cache import invalidate_book, invalidate_books
 from src.errors import (TagNotFound,BookNotFound,TagAlreadyExists)
 
 
@@ -22,7 +28,11 @@ class TagService:
         return result.all()
     async def add_tags_to_book(self,book_uid:str,tag_data:TagAddModel, session:AsyncSession):
         """Add tags to a book."""
-        book = await book_service.get_book(book_uid=book_uid, session=session)
+        statement = select(Book).where(Book.uid == book_uid).options(selectinload(Book.tags))
+        
+        result = await session.exec(statement)
+        
+        book = result.first()
         
         if not book:
             raise  BookNotFound()
@@ -36,6 +46,8 @@ class TagService:
         session.add(book)
         await session.commit()
         await session.refresh(book)
+        
+        await invalidate_book(book_uid)
         return book
     
     async def get_tag_by_uid(self,tag_uid:str, session:AsyncSession):
@@ -64,35 +76,51 @@ class TagService:
         return new_tag
     
     async def update_tag(
-        self, tag_uid, tag_update_data: TagCreateModel, session: AsyncSession
+        self, tag_uid, tag_update_data: TagCreateModel, session: AsyncSession, versions: Optional[List[int]] = None
     ):
         """Update a tag"""
 
-        tag = await self.get_tag_by_uid(tag_uid, session)
+        try:
+            tag, previous = await update_entity(session, Tag, tag_uid, tag_update_data.model_dump(), versions)
+
+        except IntegrityError:
+            # tag names are unique
+            await session.rollback()
+            raise TagAlreadyExists()
 
         if not tag:
             raise TagNotFound()
 
-        update_data_dict = tag_update_data.model_dump()
-
-        for k, v in update_data_dict.items():
-            setattr(tag, k, v)
+        if previous is None:
+            return tag
 
-            await session.commit()
+        await session.commit()
 
-            await session.refresh(tag)
+        # the tag name is rendered in the details of every book carrying it
+        await invalidate_books(await self.get_tagged_book_uids(tag.uid, session))
 
         return tag
 
     async def delete_tag(self, tag_uid: str, session: AsyncSession):
-        """Delete a tag"""
+        """Delete a tag in one statement, returning the books it was attached to"""
 
-        tag = await self.get_tag_by_uid(tag_uid,session)
+        # RETURNING runs on the statement snapshot, before the cascade removes the tag links
+        tagged_book_uids = select(func.array_agg(BookTag.book_uid)).where(BookTag.tag_uid == Tag.uid).scalar_subquery()
 
-        if not tag:
+        result = await session.exec(delete(Tag).where(Tag.uid == tag_uid).returning(Tag.uid, tagged_book_uids))
+
+        deleted = result.first()
+
+        if not deleted:
             raise TagNotFound()
 
-        await session.delete(tag)
+        await session.commit()
 
-        await session.commit() 
+        await invalidate_books(deleted[1] or [])
+
+    async def get_tagged_book_uids(self, tag_uid, session: AsyncSession):
+        """Get the uids of the books a tag is attached to."""
+        result = await session.exec(select(BookTag.book_uid).where(BookTag.tag_uid == tag_uid))
+
+        return result.all()
         
\ No newline at end of file
@@ -3,8 +3,21 @@ from src import app
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock
 from src.auth.dependencies import RoleChecker,AccessTokenBearer,RefreshTokenBearer
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import SQLModel, text
+from src.db.models import Book, Review, Tag, User
+from datetime import datetime
+from src.db.queries import track_queries
+from contextlib import contextmanager
+from src.books import routes as book_routes
+import httpx
+import os
 import pytest
 
+# Tests that need a real database run against this Postgres and are skipped when it is not set
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
 mock_session = AsyncMock()
 
 mock_user_service = AsyncMock()
@@ -50,4 +63,178 @@ def fake_book_service():
     """
     Fixture to provide a mock book service for testing.
     """
-    return mock_book_service
\ No newline at end of file
+    return mock_book_service
+
+class FakeRedis:
+    """
+    In-memory stand-in for the async Redis client.
+    """
+    def __init__(self):
+        self.store = {}
+        self.published = []
+        
+    async def get(self, name):
+        return self.store.get(name)
+    
+    async def set(self, name, value, ex=None):
+        self.store[name] = value.encode() if isinstance(value, str) else value
+        
+    async def delete(self, *names):
+        return sum(self.store.pop(name, None) is not None for name in names)
+    
+    async def zadd(self, name, mapping):
+        self.store.setdefault(name, {}).update(mapping)
+        
+    async def zscore(self, name, value):
+        return self.store.get(name, {}).get(value)
+    
+    async def zrangebyscore(self, name, min, max, withscores=False):
+        members = [(value, score) for value, score in self.store.get(name, {}).items() if float(min) <= score <= float(max)]
+        return members if withscores else [value for value, _ in members]
+    
+    async def zremrangebyscore(self, name, min, max):
+        members = self.store.get(name, {})
+        for value, score in list(members.items()):
+            if float(min) <= score <= float(max):
+                del members[value]
+                
+    async def hincrby(self, name, key, amount=1):
+        fields = self.store.setdefault(name, {})
+        fields[key] = fields.get(key, 0) + amount
+        return fields[key]
+    
+    async def hget(self, name, key):
+        return self.store.get(name, {}).get(key)
+    
+    async def hgetall(self, name):
+        return dict(self.store.get(name, {}))
+    
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    """
+    Pipeline of the in-memory Redis, queueing commands until execute.
+    """
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+        
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+    
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """
+    Fixture to replace the Redis client of the token blocklist and the principal and book caches with an in-memory one.
+    """
+    redis = FakeRedis()
+    monkeypatch.setattr("src.db.redis.redis_client", redis)
+    monkeypatch.setattr("src.auth.cache.redis_client", redis)
+    monkeypatch.setattr("src.books.cache.redis_client", redis)
+    return redis
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db_engine():
+    """
+    Fixture to provide an engine bound to a freshly created test database schema.
+    """
+    if TEST_DATABASE_URL is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+        
+    engine = create_async_engine(TEST_DATABASE_URL)
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(SQLModel.metadata.create_all)
+        
+        # the migrations install pg_trgm for the search fallback; create_all does not
+        if await conn.scalar(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")):
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        
+    yield engine
+    
+    await engine.dispose()
+
+@pytest.fixture
+async def db_session(db_engine):
+    """
+    Fixture to provide a session on the test database.
+    """
+    async with AsyncSession(db_engine, expire_on_commit=False) as session:
+        yield session
+
+@pytest.fixture
+def query_budget():
+    """
+    Fixture to assert that the statements run inside a block, e.g. one endpoint call, stay within a budget.
+    """
+    @contextmanager
+    def budget(limit):
+        with track_queries() as queries:
+            yield queries
+        
+        assert queries.count <= limit, f"{queries.count} queries over a budget of {limit}:\n" + "\n".join(queries.statements)
+        
+    return budget
+
+@pytest.fixture
+async def books_client(db_session):
+    """
+    Fixture to provide a client calling the book routes on the test database with authentication stubbed out.
+    """
+    async def get_test_session():
+        yield db_session
+    
+    overrides = {
+        get_session: get_test_session,
+        book_routes.access_token_bearer: lambda: {"user": {"user_uid": None}},
+        book_routes.role_checker.dependency: lambda: True,
+    }
+    previous = dict(app.dependency_overrides)
+    app.dependency_overrides.update(overrides)
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://localhost") as client:
+        yield client
+    
+    app.dependency_overrides.clear()
+    app.dependency_overrides.update(previous)
+
+@pytest.fixture
+def seed_books():
+    """
+    Fixture to provide a helper that commits a user with count books, each with one tag and two reviews.
+    """
+    async def seed(session, count=3):
+        user = User(username="reader", email="reader@bookly.com", first_name="Ada", last_name="Obi", password_hash="x", is_verified=True)
+        session.add(user)
+        
+        books = []
+        for i in range(count):
+            book = Book(title=f"Book {i}", author="Author", publisher="Publisher", published_date=datetime(2024, 1, 1), page_count=100, language="en", user_uid=user.uid)
+            book.tags = [Tag(name=f"tag-{i}")]
+            book.reviews = [Review(rating=4, review_text="Great", user_uid=user.uid) for _ in range(2)]
+            session.add(book)
+            books.append(book)
+        
+        await session.commit()
+        
+        return user, books
+    
+    return seed
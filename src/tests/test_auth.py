@@ -1,4 +1,10 @@
 from src.auth.schemas import UserCreate
+from src.auth.hashing import password_hasher, verify_and_update_password
+from src.auth import calibrate
+from src.config import Config
+import json
+import time
+import pytest
 
 auth_prefix = f"/api/v1/auth"
 
@@ -21,3 +27,314 @@ def test_user_creation(fake_session,fake_user_service,test_client):
     assert fake_user_service.user_exists_called_once_with(signup_data['email'],fake_session)
     assert fake_user_service.create_user_called_once()
     assert fake_user_service.create_user_called_once_with(signup_data,fake_session)
+
+
+@pytest.mark.anyio
+async def test_login_hashes_are_upgraded_to_the_configured_cost():
+    """
+    Test that hashing runs on the pool and hashes made with another bcrypt cost are flagged for rehashing.
+    """
+    from passlib.hash import bcrypt
+    
+    old_hash = bcrypt.using(rounds=4).hash("1.Omotomi")
+    completed = password_hasher.completed
+    
+    valid, new_hash = await verify_and_update_password("1.Omotomi", old_hash)
+    
+    assert valid
+    assert bcrypt.from_string(new_hash).rounds == Config.BCRYPT_ROUNDS
+    assert await verify_and_update_password("1.Omotomi", new_hash) == (True, None)
+    assert await verify_and_update_password("wrong", new_hash) == (False, None)
+    assert password_hasher.completed - completed == 3
+    assert password_hasher.in_flight == 0
+
+
+def test_calibrate_picks_highest_cost_within_target(monkeypatch):
+    """
+    Test that calibration stops at the first bcrypt cost over the latency target.
+    """
+    monkeypatch.setattr(calibrate, "measure", lambda rounds, samples: 2 ** rounds / 100)
+    
+    assert calibrate.calibrate(target_ms=50) == 12
+
+
+@pytest.mark.anyio
+async def test_token_bearer_verifies_each_token_once(monkeypatch, fake_redis):
+    """
+    Test that a repeated bearer token skips signature checks, and blocklist reads once the local blocklist is synced.
+    """
+    from src.auth import utils
+    from src.auth.dependencies import AccessTokenBearer
+    from src.db import redis
+    from src.errors import InvalidToken
+    from starlette.requests import Request
+    
+    token = utils.create_access_token(user_data={"email":"eniolaomotomi@gmail.com", "user_uid":"1", "role":"user"})
+    request = Request({"type":"http", "headers":[(b"authorization", f"Bearer {token}".encode())]})
+    bearer = AccessTokenBearer()
+    revoked_tokens = redis.RevokedTokens()
+    monkeypatch.setattr(redis, "revoked_tokens", revoked_tokens)
+    
+    decodes = []
+    decode_token = utils.decode_token
+    monkeypatch.setattr(utils, "decode_token", lambda token: decodes.append(token) or decode_token(token))
+    
+    redis_reads = []
+    zscore = fake_redis.zscore
+    monkeypatch.setattr(fake_redis, "zscore", lambda name, value: redis_reads.append(value) or zscore(name, value))
+    
+    first = await bearer(request)
+    revoked_tokens.seed([])
+    second = await bearer(request)
+    
+    assert first == second
+    assert len(decodes) == 1
+    assert redis_reads == [first["jti"]]
+    
+    await redis.add_jti_to_blocklist(first["jti"], first["exp"])
+    
+    assert fake_redis.published == [(redis.BLOCKLIST_CHANNEL, json.dumps({"jti":first["jti"], "exp":first["exp"]}))]
+    
+    with pytest.raises(InvalidToken):
+        await bearer(request)
+    
+    # another worker, seeded from Redis after the revocation
+    revoked_tokens.seed(fake_redis.store[redis.BLOCKLIST_KEY].items())
+    
+    with pytest.raises(InvalidToken):
+        await bearer(request)
+    
+    assert len(redis_reads) == 1
+
+
+def test_revoked_tokens_prune_expired_jtis_once_per_interval(monkeypatch):
+    """
+    Test that expired jtis are dropped when seeding and swept by additions at most once per prune interval.
+    """
+    from src.db import redis
+    
+    now = 1000.0
+    monkeypatch.setattr(redis.time, "time", lambda: now)
+    revoked_tokens = redis.RevokedTokens()
+    
+    revoked_tokens.seed([(b"expired", now - 1), (b"live", now + 100)])
+    assert revoked_tokens.expiries == {"live":now + 100}
+    
+    now += 200
+    revoked_tokens.add("new", now + 100)
+    assert set(revoked_tokens.expiries) == {"new"}
+    
+    now += 1
+    revoked_tokens.expiries["stale"] = now - 1
+    revoked_tokens.add("newer", now + 100)
+    assert set(revoked_tokens.expiries) == {"new", "stale", "newer"}
+    assert "stale" not in revoked_tokens
+
+
+@pytest.mark.anyio
+async def test_blocklist_sync_falls_back_to_redis_when_the_subscription_goes_quiet(fake_redis, monkeypatch):
+    """
+    Test that a subscription that stops answering pings marks the local blocklist unsynced,
+    so revocations it missed are still read from Redis.
+    """
+    import asyncio
+    from src.db import redis
+    
+    revoked_tokens = redis.RevokedTokens()
+    monkeypatch.setattr(redis, "revoked_tokens", revoked_tokens)
+    monkeypatch.setattr(Config, "BLOCKLIST_RESYNC_DELAY", 3600)
+    
+    closed = asyncio.Event()
+    
+    class SilentPubSub:
+        """
+        Subscription whose connection dropped after the seeding read: nothing arrives, pings included.
+        """
+        def __init__(self):
+            self.pings = 0
+            
+        async def subscribe(self, channel):
+            pass
+        
+        async def get_message(self, timeout=None):
+            assert revoked_tokens.synced
+            return None
+        
+        async def ping(self):
+            self.pings += 1
+            
+        async def aclose(self):
+            closed.set()
+            
+    pubsub = SilentPubSub()
+    monkeypatch.setattr(fake_redis, "pubsub", lambda: pubsub, raising=False)
+    
+    sync = asyncio.create_task(redis.sync_revoked_tokens())
+    await asyncio.wait_for(closed.wait(), 1)
+    sync.cancel()
+    
+    assert pubsub.pings == 1
+    assert not revoked_tokens.synced
+    
+    # revoked by another worker while this one was not listening
+    await fake_redis.zadd(redis.BLOCKLIST_KEY, {"missed-jti":time.time() + 60})
+    
+    assert await redis.token_in_blocklist("missed-jti")
+
+
+@pytest.mark.anyio
+async def test_principal_is_cached_until_the_user_changes(db_engine, db_session, fake_redis, seed_books):
+    """
+    Test that the principal is read from the database once, without the user's books and reviews, and refreshed after an update.
+    """
+    from src.auth.cache import get_principal, local_principals
+    from src.auth.service import UserService
+    from src.db.queries import track_queries
+    
+    user, books = await seed_books(db_session, count=2)
+    local_principals.clear()
+    
+    with track_queries() as queries:
+        principal = await get_principal(user.email, db_session)
+        
+        local_principals.clear()
+        assert await get_principal(user.email, db_session) == principal
+    
+    assert queries.count == 1
+    assert "books" not in queries.statements[0] and "review" not in queries.statements[0]
+    assert (principal.uid, principal.role, principal.is_verified) == (user.uid, "user", True)
+    
+    await UserService().update_user(user, {"role":"admin"}, db_session)
+    
+    assert (await get_principal(user.email, db_session)).role == "admin"
+    assert await get_principal("nobody@bookly.com", db_session) is None
+
+
+@pytest.mark.anyio
+async def test_revoke_user_tokens_ends_every_session(monkeypatch, fake_redis):
+    """
+    Test that moving a user to the next token generation rejects all their earlier access and refresh tokens.
+    """
+    from src.auth.utils import create_access_token
+    from src.auth.dependencies import AccessTokenBearer, RefreshTokenBearer
+    from src.db import redis
+    from src.errors import InvalidToken
+    from starlette.requests import Request
+    
+    monkeypatch.setattr(redis, "revoked_tokens", redis.RevokedTokens())
+    
+    def bearer_request(token):
+        return Request({"type":"http", "headers":[(b"authorization", f"Bearer {token}".encode())]})
+    
+    user_data = {"email":"eniolaomotomi@gmail.com", "user_uid":"1", "role":"user"}
+    access_token = create_access_token(user_data=user_data)
+    refresh_token = create_access_token(user_data=user_data, refresh=True)
+    
+    assert (await AccessTokenBearer()(bearer_request(access_token)))["gen"] == 0
+    
+    await redis.revoke_user_tokens("1")
+    
+    for bearer, token in [(AccessTokenBearer(), access_token), (RefreshTokenBearer(), refresh_token)]:
+        with pytest.raises(InvalidToken):
+            await bearer(bearer_request(token))
+    
+    new_token = create_access_token(user_data=user_data, generation=await redis.user_token_generation("1"))
+    
+    assert (await AccessTokenBearer()(bearer_request(new_token)))["gen"] == 1
+    
+    # a synced worker answers from its local copy
+    redis.revoked_tokens.seed([], await fake_redis.hgetall(redis.TOKEN_GENERATIONS_KEY))
+    
+    with pytest.raises(InvalidToken):
+        await AccessTokenBearer()(bearer_request(access_token))
+
+
+@pytest.mark.anyio
+async def test_login_is_throttled_per_account(monkeypatch):
+    """
+    Test that repeated logins for one account get 429 with Retry-After, on the local windows when Redis is down.
+    """
+    from src import app, ratelimit
+    from src.auth import routes as auth_routes
+    from redis.exceptions import RedisError
+    from unittest.mock import AsyncMock
+    import httpx
+    
+    async def redis_down(keys, args):
+        raise RedisError("Connection refused")
+    
+    monkeypatch.setattr(ratelimit, "sliding_window", redis_down)
+    monkeypatch.setattr(ratelimit, "local_windows", ratelimit.LocalWindows())
+    monkeypatch.setattr(auth_routes.user_service, "get_user_by_email", AsyncMock(return_value=None))
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://localhost") as client:
+        responses = [await client.post(f"{auth_prefix}/login", json={"email":"eniolaomotomi@gmail.com", "password":"x"}) for _ in range(6)]
+        other_account = await client.post(f"{auth_prefix}/login", json={"email":"someone@bookly.com", "password":"x"})
+    
+    assert [response.status_code for response in responses] == [400] * 5 + [429]
+    assert 0 < int(responses[-1].headers["retry-after"]) <= 60
+    assert responses[-1].json()["error_code"] == "rate_limit_exceeded"
+    assert other_account.status_code == 400
+
+
+
+@pytest.mark.anyio
+async def test_rate_limit_fallback_warns_once_per_outage(monkeypatch, caplog):
+    """
+    Test that requests limited on the local windows log one warning while Redis stays down, and that recovery is noted.
+    """
+    from src import ratelimit
+    from redis.exceptions import TimeoutError as RedisTimeoutError
+    import logging
+    
+    redis_up = False
+    
+    async def sliding_window(keys, args):
+        if not redis_up:
+            raise RedisTimeoutError("Timeout reading from socket")
+        return 0
+    
+    monkeypatch.setattr(ratelimit, "sliding_window", sliding_window)
+    monkeypatch.setattr(ratelimit, "local_windows", ratelimit.LocalWindows())
+    monkeypatch.setattr(ratelimit, "fallback_log", ratelimit.FallbackLog())
+    limiter = ratelimit.RateLimiter("test", "100/minute")
+    
+    with caplog.at_level(logging.INFO):
+        for _ in range(5):
+            assert await limiter.acquire("ratelimit:test:ip:203.0.113.1") == 0
+            
+        redis_up = True
+        assert await limiter.acquire("ratelimit:test:ip:203.0.113.1") == 0
+        
+    messages = [record.getMessage() for record in caplog.records]
+    assert len([message for message in messages if message.startswith("Rate limiting on local windows")]) == 1
+    assert "Rate limiting back on Redis" in messages
+
+
+@pytest.mark.anyio
+async def test_rate_limits_key_on_the_forwarded_client_ip(monkeypatch):
+    """
+    Test that clients behind a trusted proxy are limited by their own IP, and that a JSON body that is not an object is rejected rather than failing.
+    """
+    from src import app, ratelimit
+    from src.auth import routes as auth_routes
+    from unittest.mock import AsyncMock
+    import httpx
+    
+    keys = []
+    
+    async def acquire(self, key):
+        keys.append(key)
+        return 0
+    
+    monkeypatch.setattr(ratelimit.RateLimiter, "acquire", acquire)
+    monkeypatch.setattr(auth_routes.user_service, "get_user_by_email", AsyncMock(return_value=None))
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://localhost") as client:
+        await client.post(f"{auth_prefix}/login", json={"email":"a@bookly.com", "password":"x"}, headers={"X-Forwarded-For":"203.0.113.1"})
+        await client.post(f"{auth_prefix}/login", json={"email":"a@bookly.com", "password":"x"}, headers={"X-Forwarded-For":"203.0.113.2"})
+        not_an_object = await client.post(f"{auth_prefix}/login", json=[1])
+    
+    assert "ratelimit:auth:ip:203.0.113.1" in keys
+    assert "ratelimit:auth:ip:203.0.113.2" in keys
+    assert not_an_object.status_code == 422
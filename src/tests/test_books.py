@@ -1,3 +1,22 @@
+from src.db.models import Book, BookTag, Review
+from src.books import routes as book_routes
+from src.books.service import BookService
+from src.books.cache import book_cache_stats, book_cache_key
+from src.books.schemas import BookUpdateModel
+from src.reviews.service import ReviewService
+from src.reviews.schemas import ReviewCreateModel
+from src.tags.service import TagService
+from src.errors import InvalidCursor
+from src.db.queries import track_queries
+from src.config import Config
+from src import exports
+from sqlmodel import select, func, text
+from datetime import datetime
+import csv
+import json
+import uuid
+import pytest
+
 
 books_prefix = "/api/v1/books"
 
@@ -14,3 +33,515 @@ def test_get_all_books(test_client,fake_book_service,fake_session):
     
     assert fake_book_service.get_all_books_called_once()
     assert fake_book_service.get_all_books_called_once_with(fake_session)
+
+
+@pytest.mark.anyio
+async def test_book_endpoints_statement_count(books_client, db_engine, db_session, fake_redis, seed_books):
+    """
+    Test that list endpoints load plain columns only and the detail endpoint loads its relationships once.
+    """
+    user, books = await seed_books(db_session)
+    db_session.expunge_all()
+    
+    with track_queries() as queries:
+        response = await books_client.get(f"{books_prefix}/")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 3
+    assert queries.count == 1
+    
+    with track_queries() as queries:
+        response = await books_client.get(f"{books_prefix}/books/{user.uid}")
+    assert response.status_code == 200
+    assert queries.count == 1
+    
+    with track_queries() as queries:
+        response = await books_client.get(f"{books_prefix}/{books[0].uid}")
+    assert response.status_code == 200
+    assert len(response.json()["reviews"]) == 2
+    assert len(response.json()["tags"]) == 1
+    # the book, then one IN-query each for its reviews and tags
+    assert queries.count == 3
+    
+    # served from the cache
+    with track_queries() as queries:
+        cached_response = await books_client.get(f"{books_prefix}/{books[0].uid}")
+    assert cached_response.json() == response.json()
+    assert queries.count == 0
+
+
+@pytest.mark.anyio
+async def test_book_detail_cache_is_invalidated_on_write(db_session, fake_redis, seed_books):
+    """
+    Test that the cached book detail is read through and dropped when the book or its reviews change.
+    """
+    
+    user, books = await seed_books(db_session, count=1)
+    book_uid = str(books[0].uid)
+    book_service = book_routes.book_service
+    hits, misses = book_cache_stats.hits, book_cache_stats.misses
+    
+    await book_service.get_cached_book_details(book_uid, db_session)
+    await book_service.get_cached_book_details(book_uid.upper(), db_session)
+    assert (book_cache_stats.hits - hits, book_cache_stats.misses - misses) == (1, 1)
+    
+    update = BookUpdateModel(title="Renamed", author="Author", publisher="Publisher", page_count=120, language="en")
+    await book_service.update_book(book_uid, update, db_session)
+    assert book_cache_key(book_uid) not in fake_redis.store
+    
+    assert '"Renamed"' in await book_service.get_cached_book_details(book_uid, db_session)
+    
+    await ReviewService().add_review_to_book(user.email, book_uid, ReviewCreateModel(rating=3, review_text="Fine"), db_session)
+    assert book_cache_key(book_uid) not in fake_redis.store
+
+
+@pytest.mark.anyio
+async def test_search_books_ranks_title_matches_first(db_session):
+    """
+    Test that full-text search weights title matches above author and publisher matches and pages by rank.
+    """
+    for title, author, publisher in [
+        ("Dune", "Frank Herbert", "Chilton"),
+        ("Dune Messiah", "Frank Herbert", "Putnam"),
+        ("Children of Dune", "Frank Herbert", "Putnam"),
+        ("The Road", "Cormac McCarthy", "Dune Press"),
+        ("Emma", "Jane Austen", "John Murray"),
+    ]:
+        db_session.add(Book(title=title, author=author, publisher=publisher, published_date=datetime(2024, 1, 1), page_count=100, language="en"))
+    await db_session.commit()
+    
+    book_service = book_routes.book_service
+    
+    first_page = await book_service.search_books("dune", db_session, limit=3)
+    second_page = await book_service.search_books("dune", db_session, limit=3, cursor=first_page["next_cursor"])
+    
+    titles = [book.title for book in first_page["items"] + second_page["items"]]
+    
+    assert len(titles) == 4
+    assert titles[-1] == "The Road"
+    assert second_page["next_cursor"] is None
+
+
+async def seed_search_books(db_session):
+    for title, author in [("Dune", "Frank Herbert"), ("Emma", "Jane Austen"), ("The Road", "Cormac McCarthy")]:
+        db_session.add(Book(title=title, author=author, publisher="Publisher", published_date=datetime(2024, 1, 1), page_count=100, language="en"))
+    await db_session.commit()
+
+
+@pytest.mark.anyio
+async def test_search_books_falls_back_to_trigram_similarity(db_session, monkeypatch):
+    """
+    Test that a misspelled query without full-text matches still finds books by trigram similarity.
+    """
+    monkeypatch.setattr(BookService, "trigram_available", None)
+    
+    if not await book_routes.book_service.trigram_search_available(db_session):
+        pytest.skip("pg_trgm is not available on the test database")
+        
+    await seed_search_books(db_session)
+    
+    page = await book_routes.book_service.search_books("Herbrt", db_session, limit=10)
+    
+    assert [book.title for book in page["items"]] == ["Dune"]
+
+
+@pytest.mark.anyio
+async def test_search_books_without_pg_trgm_finds_no_fuzzy_matches(db_session, monkeypatch):
+    """
+    Test that without pg_trgm a query with no full-text matches returns an empty page instead of failing.
+    """
+    monkeypatch.setattr(BookService, "trigram_available", None)
+    
+    if await book_routes.book_service.trigram_search_available(db_session):
+        pytest.skip("pg_trgm is installed on the test database")
+        
+    await seed_search_books(db_session)
+    
+    page = await book_routes.book_service.search_books("Herbrt", db_session, limit=10)
+    
+    assert page == {"items":[], "next_cursor":None}
+
+
+@pytest.mark.anyio
+async def test_search_books_skips_the_fuzzy_fallback_when_pg_trgm_cannot_be_checked(db_session, monkeypatch):
+    """
+    Test that a failing pg_trgm check is treated as a missing extension and leaves the session usable.
+    """
+    monkeypatch.setattr(BookService, "trigram_available", None)
+    exec = db_session.exec
+    
+    async def exec_without_catalog_access(statement, *args, **kwargs):
+        if "pg_extension" in str(statement):
+            await exec(text("SELECT * FROM no_such_catalog"))
+        return await exec(statement, *args, **kwargs)
+    
+    monkeypatch.setattr(db_session, "exec", exec_without_catalog_access)
+    await seed_search_books(db_session)
+    
+    page = await book_routes.book_service.search_books("Herbrt", db_session, limit=10)
+    
+    assert page == {"items":[], "next_cursor":None}
+    assert BookService.trigram_available is False
+    assert len((await book_routes.book_service.search_books("Dune", db_session, limit=10))["items"]) == 1
+
+
+@pytest.mark.anyio
+async def test_book_reads_honour_if_none_match(books_client, db_session, fake_redis, seed_books):
+    """
+    Test that book list and detail reads answer 304 when the client already holds the current ETag.
+    """
+    user, books = await seed_books(db_session, count=2)
+    
+    for url in [f"{books_prefix}/", f"{books_prefix}/{books[0].uid}"]:
+        response = await books_client.get(url)
+        etag = response.headers["etag"]
+        
+        not_modified = await books_client.get(url, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        
+        stale = await books_client.get(url, headers={"If-None-Match": '"stale"'})
+        assert stale.status_code == 200
+    
+    list_etag = (await books_client.get(f"{books_prefix}/")).headers["etag"]
+    
+    books[1].title = "Retitled"
+    await db_session.commit()
+    
+    response = await books_client.get(f"{books_prefix}/", headers={"If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != list_etag
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("format, chunks", [
+    ("ndjson", [
+        b'{"title":"Dune","author":"Frank Herbert","publisher":"Chilton","published_date":"1965-08-01","page_count":412,"language":"en"}\n{"title":"Em',
+        b'ma","author":"Jane Austen","publisher":"John Murray","published_date":"1815-12-23","page_count":474,"language":"en"}\n',
+        b'{"title":"No date","author":"A","publisher":"P","published_date":"someday","page_count":1,"language":"en"}\n',
+        b'not json\n{"title":"Missing fields"}',
+    ]),
+    ("csv", [
+        b'title,author,publisher,published_date,page_count,language\n',
+        b'Dune,Frank Herbert,Chilton,1965-08-01,412,en\nEmma,Jane Austen,John Murray,1815-12-23,474,en\n',
+        b'No date,A,P,someday,1,en\n"Bad, pages",A,P,2001-01-01,many,en\nMissing fields\n',
+    ]),
+])
+async def test_import_books_reports_rejected_rows(db_session, monkeypatch, format, chunks, seed_books):
+    """
+    Test that a streamed import inserts valid rows in batches and reports every rejected line.
+    """
+    
+    monkeypatch.setattr(Config, "BOOKS_IMPORT_BATCH_SIZE", 1)
+    user, _ = await seed_books(db_session, count=0)
+    
+    report = await book_routes.book_service.import_books(str(user.uid), stream(*chunks), format, db_session)
+    lines = [json.loads(line) for line in b"".join(report.iter_content()).splitlines()]
+    
+    assert lines[-1] == {"inserted":2, "failed":3}
+    assert [line["line"] for line in lines[:-1]] == ([3, 4, 5] if format == "ndjson" else [4, 5, 6])
+    
+    page = await book_routes.book_service.get_user_book_submissions(user.uid, db_session, limit=10)
+    assert sorted(book.title for book in page["items"]) == ["Dune", "Emma"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("format, chunks", [
+    ("ndjson", [
+        b'\xff\xfe{"title":"Bad bytes"}\n',
+        b'{"title":"Dune","author":"Frank Herbert","publisher":"Chilton","published_date":"1965-08-01","page_count":412,"language":"en"}\n',
+    ]),
+    ("csv", [
+        b'title,author,publisher,published_date,page_count,language\n\xff\xfeBad bytes,A,P,2001-01-01,1,en\n',
+        b'Dune,Frank Herbert,Chilton,1965-08-01,412,en\n',
+    ]),
+])
+async def test_import_books_reports_undecodable_lines(db_session, format, chunks, seed_books):
+    """
+    Test that a line that is not UTF-8 is reported as a row error and the following rows are still imported.
+    """
+    user, _ = await seed_books(db_session, count=0)
+    
+    report = await book_routes.book_service.import_books(str(user.uid), stream(*chunks), format, db_session)
+    lines = [json.loads(line) for line in b"".join(report.iter_content()).splitlines()]
+    
+    assert lines[-1] == {"inserted":1, "failed":1}
+    assert lines[0]["line"] == (1 if format == "ndjson" else 2)
+    assert "utf-8" in lines[0]["errors"][0]["msg"]
+
+
+@pytest.mark.anyio
+async def test_import_books_keeps_multiline_csv_fields(db_session, seed_books):
+    """
+    Test that a quoted CSV field spanning lines and chunks keeps its newlines and later rows keep their line numbers.
+    """
+    chunks = [
+        b'title,author,publisher,published_date,page_count,language\n',
+        b'"Multiline\ntitle, with ""quotes""",A,P,2001-01-01,1,en\n"Spans\n',
+        b'two chunks",A,P,2001-01-01,1,en\n',
+        b'Bad pages,A,P,2001-01-01,many,en\n',
+    ]
+    user, _ = await seed_books(db_session, count=0)
+    
+    report = await book_routes.book_service.import_books(str(user.uid), stream(*chunks), "csv", db_session)
+    lines = [json.loads(line) for line in b"".join(report.iter_content()).splitlines()]
+    
+    assert lines[-1] == {"inserted":2, "failed":1}
+    assert lines[0]["line"] == 6
+    
+    page = await book_routes.book_service.get_user_book_submissions(user.uid, db_session, limit=10)
+    assert sorted(book.title for book in page["items"]) == ['Multiline\ntitle, with "quotes"', "Spans\ntwo chunks"]
+
+
+@pytest.mark.anyio
+async def test_import_books_resyncs_after_malformed_csv_records(db_session, seed_books):
+    """
+    Test that a stray quote inside an unquoted field and a field over the csv field size limit only reject their own record.
+    """
+    chunks = [
+        b'title,author,publisher,published_date,page_count,language\n',
+        b'Stray,O"Brien,P,2001-01-01,1,en\n',
+        b'"' + b"x" * 200 + b'",A,P,2001-01-01,1,en\n',
+        b'"Over\n' + b"x" * 200 + b'\n',
+        b'Dune,Frank Herbert,Chilton,1965-08-01,412,en\n',
+    ]
+    user, _ = await seed_books(db_session, count=0)
+    field_size_limit = csv.field_size_limit(100)
+    
+    try:
+        report = await book_routes.book_service.import_books(str(user.uid), stream(*chunks), "csv", db_session)
+        
+    finally:
+        csv.field_size_limit(field_size_limit)
+        
+    lines = [json.loads(line) for line in b"".join(report.iter_content()).splitlines()]
+    
+    assert lines[-1] == {"inserted":2, "failed":2}
+    assert [line["line"] for line in lines[:-1]] == [3, 4]
+    assert all("field limit" in line["errors"][0]["msg"] for line in lines[:-1])
+    
+    page = await book_routes.book_service.get_user_book_submissions(user.uid, db_session, limit=10)
+    assert sorted(book.title for book in page["items"]) == ["Dune", "Stray"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("format, header", [("ndjson", b""), ("csv", b"title,author,publisher,published_date,page_count,language\n")])
+async def test_import_books_skips_overlong_lines(db_session, monkeypatch, format, header, seed_books):
+    """
+    Test that a line over BOOKS_IMPORT_MAX_LINE_BYTES is reported and skipped up to the next newline, even across chunks.
+    """
+    monkeypatch.setattr(Config, "BOOKS_IMPORT_MAX_LINE_BYTES", 200)
+    row = (
+        b'{"title":"Dune","author":"Frank Herbert","publisher":"Chilton","published_date":"1965-08-01","page_count":412,"language":"en"}\n'
+        if format == "ndjson" else b'Dune,Frank Herbert,Chilton,1965-08-01,412,en\n'
+    )
+    user, _ = await seed_books(db_session, count=0)
+    
+    report = await book_routes.book_service.import_books(str(user.uid), stream(header, b"x" * 150, b"x" * 150, b"\n" + row, b"y" * 300), format, db_session)
+    lines = [json.loads(line) for line in b"".join(report.iter_content()).splitlines()]
+    
+    offset = 1 if header else 0
+    assert lines[-1] == {"inserted":1, "failed":2}
+    assert [line["line"] for line in lines[:-1]] == [1 + offset, 3 + offset]
+    assert "longer than 200 bytes" in lines[0]["errors"][0]["msg"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("format", ["ndjson", "csv"])
+async def test_export_books_streams_every_row(db_session, monkeypatch, format, seed_books):
+    """
+    Test that the export streams one line per book in cursor-sized chunks.
+    """
+    
+    monkeypatch.setattr(exports, "EXPORT_BATCH_SIZE", 2)
+    user, books = await seed_books(db_session, count=5)
+    
+    chunks = [chunk async for chunk in book_routes.book_service.export_books(db_session, format)]
+    lines = b"".join(chunks).decode().splitlines()
+    
+    if format == "csv":
+        rows = list(csv.DictReader(lines))
+        assert len(chunks) == 4
+    else:
+        rows = [json.loads(line) for line in lines]
+        assert len(chunks) == 3
+        
+    assert sorted(row["uid"] for row in rows) == sorted(str(book.uid) for book in books)
+    assert rows[0]["published_date"] == "2024-01-01T00:00:00"
+    assert "search_vector" not in rows[0]
+
+
+@pytest.mark.anyio
+async def test_rating_aggregates_follow_review_writes(db_session, fake_redis, seed_books):
+    """
+    Test that review writes keep the book aggregates in step and the books can be paged by rating.
+    """
+    
+    user, books = await seed_books(db_session, count=3)
+    book_service = book_routes.book_service
+    review_service = ReviewService()
+    
+    seeded_updated_at = [book.updated_at for book in books]
+    
+    # seed_books bypasses the service, so the aggregates start out drifted
+    assert await book_service.reconcile_rating_aggregates(db_session) == 3
+    
+    for book, updated_at in zip(books, seeded_updated_at):
+        await db_session.refresh(book, ["updated_at"])
+        assert book.updated_at > updated_at
+    
+    new_review = await review_service.add_review_to_book(user.email, str(books[1].uid), ReviewCreateModel(rating=1, review_text="Meh"), db_session)
+    await review_service.update_review(str(books[0].reviews[0].uid), ReviewCreateModel(rating=2, review_text="Worse on reread"), db_session)
+    await review_service.delete_review(str(books[2].reviews[0].uid), db_session)
+    
+    for book in books:
+        await db_session.refresh(book)
+    
+    assert [(book.review_count, book.rating_sum) for book in books] == [(2, 6), (3, 9), (1, 4)]
+    assert books[0].average_rating == 3.0
+    assert await book_service.reconcile_rating_aggregates(db_session) == 0
+    
+    first_page = await book_service.get_all_books(db_session, limit=2, sort="rating")
+    second_page = await book_service.get_all_books(db_session, limit=2, sort="rating", cursor=first_page["next_cursor"])
+    
+    assert [book.uid for book in first_page["items"] + second_page["items"]] == [books[2].uid, books[1].uid, books[0].uid]
+    
+    with pytest.raises(InvalidCursor):
+        await book_service.get_all_books(db_session, limit=2, cursor=first_page["next_cursor"])
+
+
+@pytest.mark.anyio
+async def test_book_facets_follow_filters(books_client, db_session, seed_books):
+    """
+    Test that the facet counts come from one query and honour the same filters as the book list.
+    """
+    user, books = await seed_books(db_session, count=3)
+    books[0].language = "fr"
+    books[1].author = "Other"
+    books[2].tags = []
+    await db_session.commit()
+    
+    response = await books_client.get(f"{books_prefix}/facets")
+    
+    assert response.status_code == 200
+    assert response.json() == {
+        "language":[{"value":"en", "count":2}, {"value":"fr", "count":1}],
+        "author":[{"value":"Author", "count":2}, {"value":"Other", "count":1}],
+        "tag":[{"value":"tag-0", "count":1}, {"value":"tag-1", "count":1}],
+    }
+    
+    # each facet is cut to its top values by the database
+    facets = await book_routes.book_service.get_book_facets(db_session, limit=1)
+    
+    assert facets == {
+        "language":[{"value":"en", "count":2}],
+        "author":[{"value":"Author", "count":2}],
+        "tag":[{"value":"tag-0", "count":1}],
+    }
+    
+    response = await books_client.get(f"{books_prefix}/facets", params={"language":"en"})
+    
+    assert response.json()["author"] == [{"value":"Author", "count":1}, {"value":"Other", "count":1}]
+    assert response.json()["tag"] == [{"value":"tag-1", "count":1}]
+    
+    response = await books_client.get(f"{books_prefix}/", params={"tag":"tag-0"})
+    
+    assert [book["uid"] for book in response.json()["items"]] == [str(books[0].uid)]
+    
+    response = await books_client.get(f"{books_prefix}/", params={"language":"en", "author":"Author"})
+    
+    assert [book["uid"] for book in response.json()["items"]] == [str(books[2].uid)]
+
+
+@pytest.mark.anyio
+async def test_update_book_is_one_conditional_statement(books_client, db_engine, db_session, fake_redis, seed_books):
+    """
+    Test that a book update is a single UPDATE guarded by If-Match, and that no-op updates do not write.
+    """
+    user, books = await seed_books(db_session, count=1)
+    book = books[0]
+    payload = {"title":"Renamed", "author":book.author, "publisher":book.publisher, "page_count":book.page_count, "language":book.language}
+    created_updated_at = book.updated_at.isoformat()
+    
+    with track_queries() as queries:
+        response = await books_client.patch(f"{books_prefix}/{book.uid}", json=payload, headers={"If-Match": '"1"'})
+    
+    assert response.status_code == 202
+    assert response.headers["etag"] == '"2"'
+    assert response.json()["version"] == 2
+    assert response.json()["updated_at"] != created_updated_at
+    assert [statement.split()[0] for statement in queries.statements] == ["UPDATE"]
+    
+    response = await books_client.patch(f"{books_prefix}/{book.uid}", json=payload, headers={"If-Match": '"1"'})
+    
+    assert response.status_code == 412
+    assert response.json()["error_code"] == "precondition_failed"
+    
+    with track_queries() as queries:
+        response = await books_client.patch(f"{books_prefix}/{book.uid}", json=payload)
+    
+    assert response.json()["version"] == 2
+    assert [statement.split()[0] for statement in queries.statements] == ["UPDATE", "SELECT"]
+    
+    response = await books_client.patch(f"{books_prefix}/{uuid.uuid4()}", json=payload)
+    
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_update_book_accepts_the_etag_of_a_read(books_client, db_session, fake_redis, seed_books):
+    """
+    Test that the ETag of a book detail read, echoed in If-Match, lets the update through until the book changes.
+    """
+    user, books = await seed_books(db_session, count=1)
+    book = books[0]
+    payload = {"title":"Renamed", "author":book.author, "publisher":book.publisher, "page_count":book.page_count, "language":book.language}
+    
+    for _ in range(2):
+        # the second read is served from the book cache
+        etag = (await books_client.get(f"{books_prefix}/{book.uid}")).headers["etag"]
+    
+    response = await books_client.patch(f"{books_prefix}/{book.uid}", json=payload, headers={"If-Match": etag})
+    
+    assert response.status_code == 202
+    
+    payload["title"] = "Renamed again"
+    response = await books_client.patch(f"{books_prefix}/{book.uid}", json=payload, headers={"If-Match": etag})
+    
+    assert response.status_code == 412
+
+
+@pytest.mark.anyio
+async def test_deletes_are_single_statements_with_cascades(books_client, db_engine, db_session, fake_redis, seed_books):
+    """
+    Test that deleting a book, review or tag is one DELETE whose dependent rows are removed by the database.
+    """
+    
+    user, books = await seed_books(db_session, count=2)
+    review_uid = str(books[1].reviews[0].uid)
+    tag_uid = str(books[1].tags[0].uid)
+    
+    with track_queries() as queries:
+        response = await books_client.delete(f"{books_prefix}/{books[0].uid}")
+    
+    assert response.status_code == 204
+    assert [statement.split()[0] for statement in queries.statements] == ["DELETE"]
+    assert (await db_session.exec(select(func.count()).select_from(Review))).one() == 2
+    
+    response = await books_client.delete(f"{books_prefix}/{books[0].uid}")
+    
+    assert response.status_code == 404
+    
+    await book_routes.book_service.get_cached_book_details(str(books[1].uid), db_session)
+    
+    with track_queries() as queries:
+        await ReviewService().delete_review(review_uid, db_session)
+        await TagService().delete_tag(tag_uid, db_session)
+    
+    assert [statement.split()[0] for statement in queries.statements] == ["DELETE", "UPDATE", "DELETE"]
+    assert book_cache_key(books[1].uid) not in fake_redis.store
+    assert (await db_session.exec(select(func.count()).select_from(BookTag))).one() == 0
@@ -0,0 +1,34 @@
+from src.cache import LRUCache
+import time
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """
+    Test that the cache keeps at most maxsize entries, dropping the least recently read one.
+    """
+    cache = LRUCache(maxsize=2)
+    expires_at = time.time() + 60
+    
+    cache.set("a", 1, expires_at)
+    cache.set("b", 2, expires_at)
+    assert cache.get("a") == 1
+    
+    cache.set("c", 3, expires_at)
+    
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_lru_cache_expires_entries_at_their_deadline():
+    """
+    Test that an entry is dropped once its own deadline has passed.
+    """
+    cache = LRUCache(maxsize=2)
+    
+    cache.set("stale", 1, time.time() - 1)
+    cache.set("fresh", 2, time.time() + 60)
+    
+    assert cache.get("stale") is None
+    assert cache.get("fresh") == 2
+    assert len(cache) == 1
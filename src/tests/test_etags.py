@@ -0,0 +1,32 @@
+from src.etags import compute_etag, etag_matches, if_match_versions, version_etag
+from starlette.requests import Request
+
+
+def make_request(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type":"http", "headers":headers})
+
+
+def test_compute_etag_is_strong_and_stable():
+    etag = compute_etag("a", 1)
+    
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == compute_etag("a", 1)
+    assert etag != compute_etag("a1")
+
+
+def test_etag_matches_if_none_match_lists():
+    etag = compute_etag("book")
+    
+    assert not etag_matches(make_request(), etag)
+    assert etag_matches(make_request(etag), etag)
+    assert etag_matches(make_request(f'"other", W/{etag}'), etag)
+    assert etag_matches(make_request("*"), etag)
+    assert not etag_matches(make_request('"other"'), etag)
+
+
+def test_if_match_reads_the_version_of_read_and_update_etags():
+    request = Request({"type":"http", "headers":[(b"if-match", f'{version_etag(3, "body")}, "4", W/"5", "stale"'.encode())]})
+    
+    assert version_etag(3, "body") != version_etag(3, "other body")
+    assert if_match_versions(request) == [3, 4]
@@ -0,0 +1,106 @@
+from src.mail import SMTPPool, build_message
+from src.outbox import queue_email, pending_emails, outbox_message_id
+from src.celery_tasks import send_outbox
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, timedelta
+import aiosmtplib
+import pytest
+
+
+class FakeSMTP:
+    """Records the messages sent over each connection; fails once at the message given."""
+    
+    def __init__(self, fail_at=None, **kwargs):
+        self.fail_at = fail_at
+        self.sent = []
+        self.message_ids = []
+        self.is_connected = False
+        
+    async def connect(self):
+        self.is_connected = True
+        
+    async def send_message(self, message):
+        if message["To"] == self.fail_at:
+            self.fail_at = None
+            raise aiosmtplib.SMTPServerDisconnected("Connection lost")
+        
+        self.sent.append(message["To"])
+        self.message_ids.append(message["Message-ID"])
+        
+    def close(self):
+        self.is_connected = False
+
+
+@pytest.fixture
+def smtp_connections(monkeypatch):
+    connections = []
+    
+    def connect(**kwargs):
+        connections.append(FakeSMTP(**kwargs))
+        return connections[-1]
+    
+    monkeypatch.setattr("src.mail.aiosmtplib.SMTP", connect)
+    
+    return connections
+
+
+def messages(*recipients):
+    return [build_message(recipients=[recipient], subject="Hello", body="<p>Hi</p>") for recipient in recipients]
+
+
+@pytest.mark.anyio
+async def test_smtp_pool_reuses_connections(smtp_connections):
+    """
+    Test that consecutive batches go over the same authenticated connection.
+    """
+    pool = SMTPPool(size=2)
+    
+    assert await pool.send(messages("a@example.com", "b@example.com")) == ([], None)
+    assert await pool.send(messages("c@example.com")) == ([], None)
+    
+    assert len(smtp_connections) == 1
+    assert smtp_connections[0].sent == ["a@example.com", "b@example.com", "c@example.com"]
+
+
+@pytest.mark.anyio
+async def test_smtp_pool_returns_unsent_messages_on_transient_failure(smtp_connections):
+    """
+    Test that a dropped connection stops the batch, returns what is left and is not reused.
+    """
+    pool = SMTPPool(size=1)
+    smtp_connections.append(FakeSMTP(fail_at="b@example.com"))
+    pool.idle.append((smtp_connections[0], float("inf")))
+    smtp_connections[0].is_connected = True
+    
+    unsent, error = await pool.send(messages("a@example.com", "b@example.com", "c@example.com"))
+    
+    assert [message["To"] for message in unsent] == ["b@example.com", "c@example.com"]
+    assert isinstance(error, aiosmtplib.SMTPServerDisconnected)
+    assert pool.idle == []
+    
+    assert await pool.send(unsent) == ([], None)
+    assert len(smtp_connections) == 2
+    assert smtp_connections[1].sent == ["b@example.com", "c@example.com"]
+
+
+@pytest.mark.anyio
+async def test_outbox_email_is_sent_once(monkeypatch, smtp_connections, db_engine, db_session):
+    """
+    Test that an outbox email dispatched twice, by the route and by the sweep, is delivered once.
+    """
+    monkeypatch.setattr("src.celery_tasks.Session", sessionmaker(bind=db_engine, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr("src.celery_tasks.smtp_pool", SMTPPool(size=1))
+    
+    email = queue_email(db_session, recipients=["a@example.com"], subject="Password Reset", body="<p>Reset</p>")
+    email.created_at = datetime.now() - timedelta(hours=1)
+    await db_session.commit()
+    
+    assert await pending_emails(db_session) == [email.uid]
+    
+    assert await send_outbox(email.uid) is None
+    assert await send_outbox(email.uid) is None
+    
+    assert smtp_connections[0].sent == ["a@example.com"]
+    assert smtp_connections[0].message_ids == [outbox_message_id(email.uid)]
+    assert await pending_emails(db_session) == []
@@ -0,0 +1,41 @@
+from src import app
+from src.config import Config
+import httpx
+import pytest
+
+
+@pytest.mark.anyio
+async def test_metrics_label_requests_by_route_template():
+    """
+    Test that request latencies are labelled with the route template, not the raw path.
+    """
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://localhost") as client:
+        await client.get("/api/v1/books/3fa85f64-5717-4562-b3fc-2c963f66afa6")
+        response = await client.get("/metrics")
+        
+    assert response.status_code == 200
+    
+    metrics = response.text
+    
+    assert 'bookly_http_request_duration_seconds_count{method="GET",route="/api/v1/books/{book_uid}",status="403"}' in metrics
+    assert "3fa85f64-5717-4562-b3fc-2c963f66afa6" not in metrics
+    assert "bookly_db_pool_checked_out" in metrics
+
+
+@pytest.mark.anyio
+async def test_metrics_are_only_served_to_allowed_clients(monkeypatch):
+    """
+    Test that /metrics refuses clients outside METRICS_ALLOW_IPS unless they send the metrics token.
+    """
+    monkeypatch.setattr(Config, "METRICS_TOKEN", "scrape-secret")
+    transport = httpx.ASGITransport(app=app, client=("203.0.113.7", 4321))
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        refused = await client.get("/metrics")
+        wrong_token = await client.get("/metrics", headers={"Authorization":"Bearer guess"})
+        scraped = await client.get("/metrics", headers={"Authorization":"Bearer scrape-secret"})
+        
+    assert refused.status_code == 403
+    assert wrong_token.status_code == 403
+    assert scraped.status_code == 200
+    assert 'route="/metrics"' in scraped.text
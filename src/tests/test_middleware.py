@@ -0,0 +1,36 @@
+from src import app
+from src.middleware import JSONFormatter, access_log_queue
+import httpx
+import json
+import pytest
+
+
+def drain_access_log() -> list:
+    entries = []
+    
+    while not access_log_queue.empty():
+        entries.append(json.loads(JSONFormatter().format(access_log_queue.get())))
+        
+    return entries
+
+
+@pytest.mark.anyio
+async def test_access_log_samples_successes_but_keeps_errors(monkeypatch):
+    """
+    Test that sampled-out successful requests are not logged while errors are, with their request ID.
+    """
+    monkeypatch.setattr("src.middleware.Config.ACCESS_LOG_SAMPLE_RATE", 0.0)
+    drain_access_log()
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://localhost") as client:
+        ok = await client.get("/api/v1/headers/")
+        error = await client.get("/api/v1/books/3fa85f64-5717-4562-b3fc-2c963f66afa6", headers={"X-Request-ID":"req-42"})
+        
+    assert ok.status_code == 200 and ok.headers["X-Request-ID"]
+    assert error.headers["X-Request-ID"] == "req-42"
+    
+    [entry] = drain_access_log()
+    
+    assert entry["request_id"] == "req-42"
+    assert entry["status"] == 403
+    assert entry["path"] == "/api/v1/books/3fa85f64-5717-4562-b3fc-2c963f66afa6"
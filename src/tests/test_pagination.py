@@ -0,0 +1,33 @@
+from src.pagination import encode_cursor, decode_cursor
+from src.books.service import BookService
+from src.errors import InvalidCursor
+from datetime import datetime
+import uuid
+import pytest
+
+
+def test_cursor_round_trip():
+    """
+    Test that a cursor decodes back to the key it was built from.
+    """
+    book_uid = uuid.uuid4()
+    created_at = datetime(2025, 4, 11, 11, 32, 28, 377251)
+
+    cursor = encode_cursor({"created_at":created_at.isoformat(), "uid":str(book_uid)})
+
+    assert "=" not in cursor
+    assert BookService().decode_book_cursor(cursor) == (created_at, book_uid)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor({"uid":"x"}), "WzFd"])
+def test_invalid_cursor_is_rejected(cursor):
+    """
+    Test that malformed cursors raise InvalidCursor instead of a server error.
+    """
+    with pytest.raises(InvalidCursor):
+        BookService().decode_book_cursor(cursor)
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(InvalidCursor):
+        decode_cursor("%%%")
@@ -0,0 +1,105 @@
+from fastapi import FastAPI
+from src.auth.schemas import Principal
+from src.auth.utils import create_access_token
+from src.db.db import get_session
+from src.profiling import ProfileSlot, register_profiling
+from src.ratelimit import LocalWindows
+import asyncio
+import httpx
+import time
+import uuid
+import pytest
+
+
+@pytest.fixture
+def profiled_app(monkeypatch, fake_redis):
+    """
+    Fixture to provide an app with profiling registered, admins and users resolved without a database.
+    """
+    monkeypatch.setattr("src.profiling.profile_slot", ProfileSlot())
+    monkeypatch.setattr("src.profiling.local_windows", LocalWindows())
+    
+    async def get_principal(email, session):
+        return Principal(uid=uuid.uuid4(), email=email, role=email.split("@")[0], is_verified=True)
+    
+    async def get_test_session():
+        yield None
+    
+    monkeypatch.setattr("src.auth.dependencies.get_principal", get_principal)
+    
+    app = FastAPI()
+    app.dependency_overrides[get_session] = get_test_session
+    register_profiling(app)
+    
+    return app
+
+
+def profile_headers(email, output="1"):
+    token = create_access_token(user_data={"email":email, "user_uid":str(uuid.uuid4()), "role":email.split("@")[0]})
+    return {"Authorization":f"Bearer {token}", "X-Profile":output}
+
+
+@pytest.mark.anyio
+async def test_profiles_are_returned_to_admins_only(profiled_app):
+    """
+    Test that an X-Profile request returns its profile for an admin, while other callers get the normal response without using up the cap.
+    """
+    @profiled_app.get("/books")
+    async def books():
+        return []
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=profiled_app), base_url="http://localhost") as client:
+        refused = [await client.get("/books", headers=profile_headers("user@bookly.com")) for _ in range(10)]
+        junk_token = await client.get("/books", headers={"Authorization":"Bearer junk", "X-Profile":"1"})
+        unprofiled = await client.get("/books")
+        html = await client.get("/books", headers=profile_headers("admin@bookly.com"))
+        
+    assert all(response.json() == [] for response in refused + [junk_token, unprofiled])
+    assert html.headers["content-type"].startswith("text/html")
+    assert "pyinstrument" in html.text
+
+
+@pytest.mark.anyio
+async def test_profile_samples_the_awaited_work_of_the_endpoint(profiled_app):
+    """
+    Test that the profile of an async endpoint records the coroutines it awaited.
+    """
+    async def slow_lookup():
+        await asyncio.sleep(0.05)
+        
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        
+        return []
+    
+    @profiled_app.get("/books")
+    async def books():
+        return await slow_lookup()
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=profiled_app), base_url="http://localhost") as client:
+        response = await client.get("/books", headers=profile_headers("admin@bookly.com", "speedscope"))
+        
+    assert response.headers["content-type"] == "application/json"
+    
+    frames = {frame["name"] for frame in response.json()["shared"]["frames"]}
+    assert {"books", "slow_lookup"} <= frames
+
+
+def test_profile_slot_caps_profiled_requests(monkeypatch):
+    """
+    Test that only one request is profiled at a time and at most PROFILE_RATE_LIMIT of them per window.
+    """
+    monkeypatch.setattr("src.profiling.local_windows", LocalWindows())
+    slot = ProfileSlot()
+    
+    assert slot.acquire()
+    assert not slot.acquire()
+    
+    admitted = 1
+    for _ in range(10):
+        slot.release()
+        admitted += slot.acquire()
+    
+    # the default PROFILE_RATE_LIMIT of 6/minute
+    assert admitted == 6
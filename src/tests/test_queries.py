@@ -0,0 +1,40 @@
+from src.db.queries import QueryStats, statement_shape
+import pytest
+
+books_prefix = "/api/v1/books"
+
+
+def test_repeated_statement_shapes_are_reported():
+    """
+    Test that statements differing only in their parameters count as one shape.
+    """
+    stats = QueryStats()
+    
+    for uids in (1, 2, 3):
+        params = ", ".join(f"${i}::UUID" for i in range(1, uids + 1))
+        stats.record(f"SELECT review.uid FROM review WHERE review.book_uid IN ({params})", 0.001)
+    stats.record("SELECT books.uid FROM books WHERE books.uid = $1::UUID", 0.001)
+    
+    assert statement_shape(stats.statements[2]) == "SELECT review.uid FROM review WHERE review.book_uid IN (?)"
+    assert stats.repeated(threshold=3) == [("SELECT review.uid FROM review WHERE review.book_uid IN (?)", 3)]
+    assert stats.count == 4
+
+
+@pytest.mark.anyio
+async def test_endpoints_stay_within_query_budget(books_client, db_session, fake_redis, query_budget, seed_books):
+    """
+    Test that list and detail endpoints keep a fixed number of statements however many rows they return.
+    """
+    user, books = await seed_books(db_session, count=5)
+    db_session.expunge_all()
+    
+    with query_budget(1):
+        response = await books_client.get(f"{books_prefix}/")
+    assert len(response.json()["items"]) == 5
+    
+    with query_budget(1):
+        response = await books_client.get("/api/v1/tags/")
+    assert len(response.json()) == 5
+    
+    with query_budget(3):
+        await books_client.get(f"{books_prefix}/{books[0].uid}")
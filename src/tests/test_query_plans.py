@@ -0,0 +1,74 @@
+from src.auth.service import UserService
+from src.books.service import BookService
+from src.reviews.service import ReviewService
+from src.tags.service import TagService
+from src.db.queries import track_queries
+from sqlalchemy import text
+import pytest
+
+
+async def explain(db_session, statement, parameters) -> str:
+    """
+    EXPLAIN a captured statement with sequential scans priced out, so a seq scan means no index can serve it.
+
+    The seeded tables are tiny, and the planner would otherwise prefer scanning them whole.
+    """
+    connection = await db_session.connection()
+    await connection.execute(text("SET LOCAL enable_seqscan = off"))
+
+    result = await connection.exec_driver_sql(f"EXPLAIN {statement}", tuple(parameters))
+
+    return "\n".join(row[0] for row in result)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name, indexes", [
+    ("user_by_email", ["ix_users_email", "ix_books_user_uid_created_at_uid", "ix_review_user_uid"]),
+    ("book_details", ["books_pkey", "ix_review_book_uid", "booktag_pkey", "tags_pkey"]),
+    ("book_list", ["ix_books_created_at_uid"]),
+    ("book_list_by_rating", ["ix_books_average_rating_created_at_uid"]),
+    ("book_list_by_language", ["ix_books_language_created_at_uid"]),
+    ("book_list_by_tag", ["ix_tags_name"]),
+    ("user_book_submissions", ["ix_books_user_uid_created_at_uid"]),
+    ("review_by_uid", ["review_pkey"]),
+    ("tagged_book_uids", ["ix_booktag_tag_uid_book_uid"]),
+])
+async def test_hot_queries_use_indexes(db_engine, db_session, name, indexes, seed_books):
+    """
+    Test that every statement of the hot service queries is planned on an index.
+    """
+    user, books = await seed_books(db_session, count=3)
+    book = books[0]
+
+    queries = {
+        "user_by_email": lambda: UserService().get_user_by_email(user.email, db_session),
+        "book_details": lambda: BookService().get_book_details(str(book.uid), db_session),
+        "book_list": lambda: BookService().get_all_books(db_session, limit=2),
+        "book_list_by_rating": lambda: BookService().get_all_books(db_session, limit=2, sort="rating"),
+        "book_list_by_language": lambda: BookService().get_all_books(db_session, limit=2, filters={"language":"en"}),
+        "book_list_by_tag": lambda: BookService().get_all_books(db_session, limit=2, filters={"tag":"tag-0"}),
+        "user_book_submissions": lambda: BookService().get_user_book_submissions(str(user.uid), db_session, limit=2),
+        "review_by_uid": lambda: ReviewService().get_review_by_id(str(book.reviews[0].uid), db_session),
+        "tagged_book_uids": lambda: TagService().get_tagged_book_uids(book.tags[0].uid, db_session),
+    }
+
+    db_session.expunge_all()
+
+    with track_queries() as tracked:
+        await queries[name]()
+
+    captured = [
+        (statement, parameters)
+        for statement, parameters in zip(tracked.statements, tracked.parameters)
+        if statement.lstrip().upper().startswith("SELECT")
+    ]
+
+    assert captured
+
+    plans = [await explain(db_session, statement, parameters) for statement, parameters in captured]
+
+    for plan in plans:
+        assert "Seq Scan" not in plan, plan
+
+    for index in indexes:
+        assert any(index in plan for plan in plans), "\n\n".join(plans)
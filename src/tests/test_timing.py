@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, FastAPI
+from src.timing import TimedRoute, timed
+import httpx
+import pytest
+
+
+@pytest.mark.anyio
+async def test_timed_routes_report_server_timing(monkeypatch):
+    """
+    Test that a timed route reports its dependencies' phases, the endpoint and serialization, and nothing when disabled.
+    """
+    async def principal():
+        with timed("principal"):
+            return "reader"
+    
+    def make_app():
+        router = APIRouter(route_class=TimedRoute)
+        
+        @router.get("/async")
+        async def async_endpoint(user: str = Depends(principal)) -> dict:
+            return {"user":user}
+        
+        @router.get("/sync")
+        def sync_endpoint() -> dict:
+            return {"user":"reader"}
+        
+        app = FastAPI()
+        app.include_router(router)
+        
+        return app
+    
+    monkeypatch.setattr("src.timing.Config.SERVER_TIMING", True)
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=make_app()), base_url="http://localhost") as client:
+        async_response = await client.get("/async")
+        sync_response = await client.get("/sync")
+        
+    phases = [entry.split(";")[0] for entry in async_response.headers["Server-Timing"].split(", ")]
+    assert phases == ["principal", "handler", "sql", "serialize", "total"]
+    assert async_response.json() == {"user":"reader"}
+    assert "handler;dur=" in sync_response.headers["Server-Timing"]
+    
+    monkeypatch.setattr("src.timing.Config.SERVER_TIMING", False)
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=make_app()), base_url="http://localhost") as client:
+        response = await client.get("/async")
+        
+    assert "Server-Timing" not in response.headers
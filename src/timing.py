@@ -0,0 +1,125 @@
+from fastapi.routing import APIRoute
+from fastapi.requests import Request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from src.db.queries import track_queries
+from src.config import Config
+from typing import Callable, Dict, Iterator, Optional
+import asyncio
+import functools
+import time
+
+
+class ServerTiming:
+    """Time spent in each phase of one request, reported in a Server-Timing header."""
+    
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self.endpoint_finished: Optional[float] = None
+        
+    def add(self, name:str, seconds:float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items())
+
+
+current_timing: ContextVar[Optional[ServerTiming]] = ContextVar("current_timing", default=None)
+
+
+@contextmanager
+def timed(name:str) -> Iterator[None]:
+    """Add the time the block takes to a phase of the current request; free when timing is off."""
+    timing = current_timing.get()
+    
+    if timing is None:
+        yield
+        return
+    
+    started = time.perf_counter()
+    
+    try:
+        yield
+        
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def timed_endpoint(call:Callable) -> Callable:
+    """Wrap an endpoint so its own run is the handler phase and the time after it is serialization."""
+    def finished():
+        timing = current_timing.get()
+        
+        if timing is not None:
+            timing.endpoint_finished = time.perf_counter()
+            
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            with timed("handler"):
+                result = await call(*args, **kwargs)
+                
+            finished()
+            
+            return result
+        
+    else:
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            with timed("handler"):
+                result = call(*args, **kwargs)
+                
+            finished()
+            
+            return result
+        
+    return endpoint
+
+
+class TimedRoute(APIRoute):
+    """Route returning a Server-Timing breakdown of its requests when SERVER_TIMING is on.
+    
+    Dependencies report their own phases through timed(); the route adds the endpoint
+    (handler), the statements it ran (sql), response serialization and the total.
+    With SERVER_TIMING off it is a plain APIRoute.
+    """
+    
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        
+        # the request handler built by APIRoute reads dependant.call on every request
+        if Config.SERVER_TIMING:
+            self.dependant.call = timed_endpoint(self.dependant.call)
+            
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        
+        if not Config.SERVER_TIMING:
+            return handler
+        
+        async def timed_handler(request: Request):
+            timing = ServerTiming()
+            token = current_timing.set(timing)
+            started = time.perf_counter()
+            
+            try:
+                with track_queries() as queries:
+                    response = await handler(request)
+                    
+            finally:
+                current_timing.reset(token)
+                
+            now = time.perf_counter()
+            
+            timing.add("sql", queries.seconds)
+            
+            if timing.endpoint_finished is not None:
+                timing.add("serialize", now - timing.endpoint_finished)
+                
+            timing.add("total", now - started)
+            
+            response.headers.append("Server-Timing", timing.header())
+            
+            return response
+        
+        return timed_handler